@@ -0,0 +1,156 @@
+"""Асинхронные точки входа для представлений API.
+
+Django 3.2 и DRF не умеют выполнять ORM и представления DRF асинхронно,
+а синхронные представления под ASGI по умолчанию выполняются в одном
+общем потоке. Здесь читающие запросы (GET, HEAD, OPTIONS) уходят в
+отдельный пул потоков, и воркер ASGI-сервера обслуживает одновременно
+до ASYNC_READ_WORKERS запросов к БД, а медленные клиенты ждут в
+цикле событий, не занимая потоков. Пишущие запросы идут в общий поток,
+как у обычных синхронных представлений.
+
+Потоковые ответы (выгрузка списка покупок) StreamingASGIHandler читает
+в потоке того же пула и передаёт в цикл событий через очередь из
+STREAM_QUEUE_SIZE частей, поэтому в памяти не копится весь ответ.
+"""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.db import close_old_connections
+from django.urls import URLPattern
+from rest_framework.permissions import SAFE_METHODS
+
+from backend.db_router import close_unusable_connections
+
+from .timing import timed
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.ASYNC_READ_WORKERS,
+    thread_name_prefix='api-read',
+)
+STREAM_QUEUE_SIZE = 16
+STREAM_END = object()
+
+
+def run_read_view(view, request, *args, **kwargs):
+    """Выполняет представление в потоке пула и готовит тело ответа.
+
+    У каждого потока пула своё соединение с БД, поэтому устаревшие
+    соединения закрываются здесь, а не обработчиками сигналов запроса.
+    """
+    close_old_connections()
+    close_unusable_connections()
+    try:
+        response = view(request, *args, **kwargs)
+        if callable(getattr(response, 'render', None)):
+            with timed('render'):
+                response.render()
+        return response
+    finally:
+        close_old_connections()
+
+
+def produce_parts(parts, put, stopped):
+    """Перебирает части ответа в потоке пула и передаёт их в put."""
+    close_old_connections()
+    try:
+        for part in parts:
+            if stopped.is_set():
+                return
+            put(part)
+        put(STREAM_END)
+    except Exception as error:
+        put(error)
+    finally:
+        close_old_connections()
+
+
+async def stream_in_thread(parts):
+    """Части потокового ответа, прочитанные в потоке пула.
+
+    Поток ждёт, пока в очереди освободится место, поэтому медленный
+    клиент придерживает чтение, а не копит ответ в памяти.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=STREAM_QUEUE_SIZE)
+    stopped = threading.Event()
+
+    def put(item):
+        asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+
+    loop.run_in_executor(executor, produce_parts, parts, put, stopped)
+    try:
+        while True:
+            item = await queue.get()
+            if item is STREAM_END:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        # Клиент отключился: освобождаем поток, ждущий места в очереди.
+        stopped.set()
+        while not queue.empty():
+            queue.get_nowait()
+
+
+class StreamingASGIHandler(ASGIHandler):
+    """Обработчик ASGI, который читает потоковые ответы в потоке пула.
+
+    Django 3.2 перебирает потоковый ответ прямо в цикле событий, где
+    обращения к БД запрещены и любое ожидание останавливает воркер.
+    """
+
+    async def send_response(self, response, send):
+        if not response.streaming:
+            return await super().send_response(response, send)
+        parts = iter(response)
+        response.streaming_content = ()
+
+        async def send_with_parts(message):
+            # Базовый обработчик шлёт заголовки и пустое тело; части
+            # ответа уходят перед завершающим сообщением.
+            if message['type'] == 'http.response.body' and not message.get(
+                'more_body'
+            ):
+                async for part in stream_in_thread(parts):
+                    for chunk, _ in self.chunk_bytes(part):
+                        await send({
+                            'type': 'http.response.body',
+                            'body': chunk,
+                            'more_body': True,
+                        })
+            await send(message)
+
+        return await super().send_response(response, send_with_parts)
+
+
+def async_read_view(view):
+    """Асинхронная обёртка над синхронным представлением."""
+    read = sync_to_async(
+        run_read_view, thread_sensitive=False, executor=executor
+    )
+    write = sync_to_async(view)
+
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method in SAFE_METHODS:
+            return await read(view, request, *args, **kwargs)
+        return await write(request, *args, **kwargs)
+
+    return wrapper
+
+
+def async_read_urls(patterns):
+    """Те же маршруты с асинхронными обёртками представлений."""
+    return [
+        URLPattern(
+            pattern.pattern, async_read_view(pattern.callback),
+            pattern.default_args, pattern.name,
+        )
+        for pattern in patterns
+    ]
@@ -0,0 +1,158 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.db.models import F, QuerySet
+from django.http import HttpResponse
+from django.utils.cache import (get_conditional_response, patch_cache_control,
+                                quote_etag)
+from django.utils.http import http_date
+
+from backend.db_router import use_primary
+from backend.versions import get_version
+from recipes.models import Recipe, Tag
+
+TAG_IDS_KEY = 'tag-ids:{}'
+RECIPE_DOCUMENT_KEY = 'recipe-document:{}:{}:{}'
+
+pending_invalidations = ContextVar('pending_invalidations', default=None)
+
+
+def get_tag_ids():
+    """Соответствие slug -> id тегов, закэшированное до их изменения."""
+    key = TAG_IDS_KEY.format(get_version('tags'))
+    tag_ids = cache.get(key)
+    if tag_ids is None:
+        with use_primary():
+            tag_ids = dict(Tag.objects.values_list('slug', 'id'))
+        cache.set(key, tag_ids, settings.REFERENCE_CACHE_TIMEOUT)
+    return tag_ids
+
+
+def recipe_document_keys(recipes):
+    """Ключи кэша документов рецептов: {ключ: id рецепта}.
+
+    Ключ включает общую версию документов и версию рецепта из строки,
+    прочитанной запросом страницы. Документ, построенный до сброса,
+    ляжет под ключ, который после коммита сброса уже никто не прочитает.
+    """
+    version = get_version('recipe-documents')
+    return {
+        RECIPE_DOCUMENT_KEY.format(
+            version, recipe.id, recipe.document_version
+        ): recipe.id
+        for recipe in recipes
+    }
+
+
+def get_recipe_documents(recipes, build):
+    """Документы рецептов {id: документ} одним обращением к кэшу.
+
+    Недостающие документы строятся функцией build(ids) пакетом и
+    кладутся в кэш. Документы рецептов, которых уже нет, не возвращаются.
+    """
+    documents_cache = caches['recipe-documents']
+    keys = recipe_document_keys(recipes)
+    cached = documents_cache.get_many(list(keys))
+    documents = {keys[key]: document for key, document in cached.items()}
+    missing = [
+        recipe_id for key, recipe_id in keys.items() if key not in cached
+    ]
+    if missing:
+        with use_primary():
+            built = build(missing)
+        documents_cache.set_many({
+            key: built[recipe_id] for key, recipe_id in keys.items()
+            if recipe_id in built
+        }, settings.RECIPE_DOCUMENT_TIMEOUT)
+        documents.update(built)
+    return documents
+
+
+def invalidate_recipe_documents(recipes):
+    """Поднимает версии документов рецептов в той же транзакции, что и
+    изменение, поэтому версия и данные рецепта всегда согласованы.
+
+    recipes — queryset рецептов или список их id. Внутри
+    batch_invalidations() id копятся до конца блока.
+    """
+    pending = pending_invalidations.get()
+    if pending is not None and not isinstance(recipes, QuerySet):
+        pending.update(recipes)
+        return
+    if not isinstance(recipes, QuerySet):
+        recipes = Recipe.objects.filter(id__in=list(recipes))
+    recipes.update(document_version=F('document_version') + 1)
+
+
+@contextmanager
+def batch_invalidations():
+    """Поднимает версии всех сброшенных в блоке документов одним запросом.
+
+    Сигналы строк состава срабатывают на каждую строку, и без этого
+    изменение или удаление рецепта поднимало бы версию много раз.
+    """
+    pending = set()
+    token = pending_invalidations.set(pending)
+    try:
+        yield
+    finally:
+        pending_invalidations.reset(token)
+    if pending:
+        invalidate_recipe_documents(pending)
+
+
+class CachedReferenceMixin:
+    """Кэширует ответы справочника и отвечает на условные запросы.
+
+    Ключ ответа включает версию справочника, поэтому при изменении данных
+    старые записи просто перестают читаться и вытесняются кэшем.
+    """
+
+    cache_namespace = None
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(
+            request, lambda: super(CachedReferenceMixin, self).list(
+                request, *args, **kwargs
+            ), *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            request, lambda: super(CachedReferenceMixin, self).retrieve(
+                request, *args, **kwargs
+            ), *args, **kwargs
+        )
+
+    def cached_response(self, request, handler, *args, **kwargs):
+        if request.accepted_renderer.format != 'json':
+            return handler()
+        version = get_version(self.cache_namespace)
+        key = ':'.join([
+            self.cache_namespace, str(version), request.get_full_path(),
+        ])
+        cached = cache.get(key)
+        if cached is None:
+            with use_primary():
+                response = handler()
+            if response.status_code != 200:
+                return response
+            response = self.finalize_response(
+                request, response, *args, **kwargs
+            ).render()
+            cached = (response['Content-Type'], response.content)
+            cache.set(key, cached, settings.REFERENCE_CACHE_TIMEOUT)
+        content_type, content = cached
+        response = HttpResponse(content, content_type=content_type)
+        etag = quote_etag(md5(key.encode()).hexdigest())
+        last_modified = int(version)
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(response, public=True, no_cache=True)
+        return get_conditional_response(
+            request, etag=etag, last_modified=last_modified,
+            response=response,
+        )
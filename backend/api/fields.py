@@ -0,0 +1,78 @@
+import base64
+import binascii
+import os.path
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import UploadedFile
+from django.core.validators import get_available_image_extensions
+from drf_extra_fields.fields import Base64ImageField
+from rest_framework.fields import Field
+from rest_framework.serializers import ValidationError
+
+from recipes.images import (RENDITION_META_KEYS, TOO_LARGE_MESSAGE,
+                            check_image_header)
+
+
+class DeferredBase64ImageField(Base64ImageField):
+    """Изображение, декодируемое в фоне после сохранения.
+
+    Принимает строку base64 или файл из multipart-запроса. В запросе
+    проверяются размер, base64 и заголовок изображения; в validated_data
+    попадает файл, а полная проверка и уменьшенные копии делаются в фоне.
+    """
+
+    def to_internal_value(self, base64_data):
+        if base64_data in self.EMPTY_VALUES:
+            return None
+        if isinstance(base64_data, UploadedFile):
+            return self.validate_upload(base64_data)
+        if not isinstance(base64_data, str):
+            raise ValidationError(self.INVALID_FILE_MESSAGE)
+        header, _, payload = base64_data.rpartition(';base64,')
+        if header and not header.startswith('data:image/'):
+            raise ValidationError(self.INVALID_TYPE_MESSAGE)
+        if len(payload) * 3 // 4 > settings.RECIPE_IMAGE_MAX_SIZE:
+            raise ValidationError(TOO_LARGE_MESSAGE)
+        try:
+            content = base64.b64decode(payload, validate=True)
+        except (binascii.Error, ValueError):
+            raise ValidationError(self.INVALID_FILE_MESSAGE)
+        image_format = check_image_header(BytesIO(content))
+        if image_format is None:
+            raise ValidationError(self.INVALID_FILE_MESSAGE)
+        return ContentFile(content, name=f'image.{image_format.lower()}')
+
+    def validate_upload(self, upload):
+        extension = os.path.splitext(upload.name)[1][1:].lower()
+        if extension not in get_available_image_extensions():
+            raise ValidationError(self.INVALID_TYPE_MESSAGE)
+        if upload.size > settings.RECIPE_IMAGE_MAX_SIZE:
+            raise ValidationError(TOO_LARGE_MESSAGE)
+        if check_image_header(upload) is None:
+            raise ValidationError(self.INVALID_FILE_MESSAGE)
+        return upload
+
+
+class ImageRenditionsField(Field):
+    """Ссылки на уменьшенные копии изображения по размерам и форматам."""
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, renditions):
+        request = self.context.get('request')
+        result = {}
+        for size_name, paths in renditions.items():
+            if size_name in RENDITION_META_KEYS:
+                continue
+            result[size_name] = {}
+            for extension, path in paths.items():
+                url = default_storage.url(path)
+                if request is not None:
+                    url = request.build_absolute_uri(url)
+                result[size_name][extension] = url
+        return result
@@ -1,7 +1,11 @@
 import django_filters.rest_framework.filters as filters
+from django.db.models import Exists, OuterRef
 from django_filters.rest_framework import FilterSet
 
 from recipes.models import Ingredient, Recipe
+from recipes.search import search_recipes
+
+from .caching import get_tag_ids
 
 
 class IngredientsSearchFilter(FilterSet):
@@ -20,8 +24,13 @@ class IngredientsSearchFilter(FilterSet):
 class RecipeFilter(FilterSet):
     """Фильтр рецептов."""
 
-    tags = filters.AllValuesMultipleFilter(
-        field_name='tags__slug',
+    tags = filters.MultipleChoiceFilter(
+        choices=lambda: [(slug, slug) for slug in get_tag_ids()],
+        method='get_tags',
+    )
+    tags_mode = filters.ChoiceFilter(
+        choices=[('any', 'Любой из тегов'), ('all', 'Все теги')],
+        method='get_tags_mode',
     )
     is_favorited = filters.BooleanFilter(
         method='get_is_favorited',
@@ -29,22 +38,66 @@ class RecipeFilter(FilterSet):
     is_in_shopping_cart = filters.BooleanFilter(
         method='get_is_in_shopping_cart',
     )
+    search = filters.CharFilter(
+        method='get_search',
+    )
+    ordering = filters.ChoiceFilter(
+        choices=[('popular', 'По популярности')],
+        method='get_ordering',
+    )
+
+    popular_ordering = ('-favorites_count', '-pub_date', '-id')
+    search_ordering = ('-rank', '-pub_date', '-id')
 
     class Meta:
         model = Recipe
         fields = [
             'author',
             'tags',
+            'tags_mode',
             'is_favorited',
             'is_in_shopping_cart',
+            'search',
+            'ordering',
         ]
 
+    def get_tags(self, queryset, name, value):
+        """Фильтр по тегам через EXISTS: без JOIN и повторов рецептов."""
+        tag_ids = get_tag_ids()
+        tag_ids = [tag_ids[slug] for slug in value if slug in tag_ids]
+        recipe_tags = Recipe.tags.through.objects.filter(
+            recipe=OuterRef('pk')
+        )
+        if self.form.cleaned_data.get('tags_mode') == 'all':
+            for tag_id in tag_ids:
+                queryset = queryset.filter(
+                    Exists(recipe_tags.filter(tag_id=tag_id))
+                )
+            return queryset
+        return queryset.filter(Exists(recipe_tags.filter(tag_id__in=tag_ids)))
+
+    def get_tags_mode(self, queryset, name, value):
+        # Учитывается в get_tags.
+        return queryset
+
     def get_is_favorited(self, queryset, name, value):
         if value and self.request.user.is_authenticated:
-            return queryset.filter(in_favorite__user=self.request.user)
+            return queryset.filter(is_favorited=True)
         return queryset
 
     def get_is_in_shopping_cart(self, queryset, name, value):
         if value and self.request.user.is_authenticated:
-            return queryset.filter(shopping_cart__user=self.request.user)
+            return queryset.filter(is_in_shopping_cart=True)
+        return queryset
+
+    def get_search(self, queryset, name, value):
+        if not value.strip():
+            return queryset
+        return search_recipes(queryset, value).order_by(
+            *self.search_ordering
+        )
+
+    def get_ordering(self, queryset, name, value):
+        if value == 'popular':
+            return queryset.order_by(*self.popular_ordering)
         return queryset
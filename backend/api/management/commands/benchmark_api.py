@@ -0,0 +1,336 @@
+import json
+import time
+from urllib.parse import parse_qs, urlparse
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIClient
+
+from api.nplusone import NPlusOneError
+from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
+from users.models import User
+
+
+def recipe_payload(params):
+    return {
+        'ingredients': [
+            {'id': ingredient_id, 'amount': 10}
+            for ingredient_id in params['ingredients'].split(',')
+        ],
+        'tags': [params['tag_id']],
+        'image': '',
+        'name': 'Рецепт для замера',
+        'text': 'Смешать и подать.',
+        'cooking_time': 15,
+    }
+
+
+def recipe_patch(params):
+    return {
+        'name': 'Рецепт после замера',
+        'ingredients': [{'id': params['ingredient'], 'amount': 5}],
+    }
+
+
+def bulk_recipes(params):
+    return {'recipes': params['bulk']}
+
+
+# Название сценария, HTTP-метод, адрес, ожидаемый статус, лимит запросов
+# и, для пишущих сценариев с телом, функция, строящая тело по параметрам.
+# {created} в адресе — рецепт, который сценарий создаёт перед запросом.
+SCENARIOS = [
+    ('recipes-list', 'get', '/api/recipes/', 200, 2),
+    ('recipes-list-filtered', 'get',
+     '/api/recipes/?tags={tag}&is_favorited=1', 200, 2),
+    ('recipes-list-cursor', 'get', '/api/recipes/?cursor=', 200, 2),
+    ('recipes-list-search', 'get', '/api/recipes/?search={word}', 200, 2),
+    ('recipes-feed', 'get', '/api/recipes/feed/', 200, 2),
+    ('recipes-feed-next-page', 'get', '/api/recipes/feed/?cursor={feed}',
+     200, 2),
+    ('recipes-cookable', 'get',
+     '/api/recipes/cookable/?ingredients={ingredients}', 200, 2),
+    ('recipes-list-anonymous', 'anonymous', '/api/recipes/', 200, 2),
+    ('recipes-detail', 'get', '/api/recipes/{recipe}/', 200, 1),
+    ('recipes-download-shopping-cart', 'get',
+     '/api/recipes/download_shopping_cart/', 200, 1),
+    ('recipes-favorite-add', 'post',
+     '/api/recipes/{recipe}/favorite/', 201, 5),
+    ('recipes-favorite-remove', 'delete',
+     '/api/recipes/{recipe}/favorite/', 204, 4),
+    ('recipes-shopping-cart-add', 'post',
+     '/api/recipes/{recipe}/shopping_cart/', 201, 9),
+    ('recipes-shopping-cart-remove', 'delete',
+     '/api/recipes/{recipe}/shopping_cart/', 204, 8),
+    ('recipes-favorite-bulk-add', 'post', '/api/recipes/favorite/', 200,
+     6, bulk_recipes),
+    ('recipes-favorite-bulk-replace', 'put', '/api/recipes/favorite/', 200,
+     8, bulk_recipes),
+    ('recipes-favorite-bulk-remove', 'delete', '/api/recipes/favorite/',
+     200, 5, bulk_recipes),
+    ('recipes-shopping-cart-bulk-add', 'post', '/api/recipes/shopping_cart/',
+     200, 10, bulk_recipes),
+    ('recipes-shopping-cart-bulk-replace', 'put',
+     '/api/recipes/shopping_cart/', 200, 13, bulk_recipes),
+    ('recipes-shopping-cart-bulk-remove', 'delete',
+     '/api/recipes/shopping_cart/', 200, 9, bulk_recipes),
+    ('recipes-create', 'post', '/api/recipes/', 201, 23, recipe_payload),
+    ('recipes-update', 'patch', '/api/recipes/{own_recipe}/', 200, 26,
+     recipe_patch),
+    ('recipes-delete', 'delete', '/api/recipes/{created}/', 204, 18),
+    ('users-list', 'get', '/api/users/', 200, 2),
+    ('users-detail', 'get', '/api/users/{author}/', 200, 1),
+    ('users-me', 'get', '/api/users/me/', 200, 1),
+    ('users-subscriptions', 'get',
+     '/api/users/subscriptions/?recipes_limit=3', 200, 3),
+    ('users-subscribe', 'post', '/api/users/{author}/subscribe/', 201, 9),
+    ('users-unsubscribe', 'delete',
+     '/api/users/{author}/subscribe/', 204, 4),
+    ('ingredients-list', 'get', '/api/ingredients/', 200, 1),
+    ('ingredients-search', 'get', '/api/ingredients/?name={prefix}', 200, 1),
+    ('ingredients-detail', 'get', '/api/ingredients/{ingredient}/', 200, 1),
+    ('tags-list', 'get', '/api/tags/', 200, 1),
+    ('tags-detail', 'get', '/api/tags/{tag_id}/', 200, 1),
+]
+
+
+def percentile(values, percent):
+    """Значение перцентиля методом ближайшего ранга."""
+    ordered = sorted(values)
+    index = max(0, int(round(percent / 100 * len(ordered))) - 1)
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет число SQL-запросов и время ответа для каждого адреса API '
+        'и сохраняет отчёт в JSON.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--viewer', help='email пользователя-зрителя.')
+        parser.add_argument('--output', help='Путь к JSON-отчёту.')
+        parser.add_argument(
+            '--nplusone', action='store_true',
+            help='Считать ошибкой повторы SQL-запросов одной формы.',
+        )
+
+    def handle(self, *args, **options):
+        if options['nplusone']:
+            with override_settings(
+                NPLUSONE_DETECTION=True, NPLUSONE_RAISE=True
+            ):
+                return self.run(options)
+        return self.run(options)
+
+    def run(self, options):
+        viewer = self.get_viewer(options['viewer'])
+        params = self.get_params(viewer)
+        client = APIClient(SERVER_NAME='localhost')
+        client.force_authenticate(viewer)
+        anonymous = APIClient(SERVER_NAME='localhost')
+
+        self.viewer, self.params = viewer, params
+        results = []
+        for name, method, path, status, max_queries, *body in SCENARIOS:
+            path = path.format(created='{created}', **params)
+            data = body[0](params) if body else None
+            if method == 'anonymous':
+                method, scenario_client = 'get', anonymous
+            else:
+                scenario_client = client
+            try:
+                results.append(self.run_scenario(
+                    scenario_client, name, method, path, data, status,
+                    max_queries, options['iterations'],
+                ))
+            except NPlusOneError as error:
+                results.append({
+                    'name': name,
+                    'method': method.upper(),
+                    'path': path,
+                    'nplusone': str(error),
+                    'failed': True,
+                })
+
+        failures = [row['name'] for row in results if row['failed']]
+        report = {
+            'database': connection.vendor,
+            'iterations': options['iterations'],
+            'results': results,
+            'failures': failures,
+        }
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+        else:
+            self.stdout.write(json.dumps(report, ensure_ascii=False, indent=2))
+        if failures:
+            raise CommandError(
+                'Превышен лимит запросов, неверный статус или N+1: '
+                + ', '.join(failures)
+            )
+
+    def get_viewer(self, email):
+        if email:
+            return User.objects.get(email=email)
+        viewer = User.objects.annotate(
+            follows=Count('follower')
+        ).order_by('-follows', 'id').first()
+        if viewer is None:
+            raise CommandError('База пуста, запустите seed_data.')
+        return viewer
+
+    def get_params(self, viewer):
+        """Подбирает объекты, с которыми сценарии работают без конфликтов."""
+        free_recipes = Recipe.objects.exclude(author=viewer).exclude(
+            in_favorite__user=viewer
+        ).exclude(shopping_cart__user=viewer).order_by('id')
+        recipe = free_recipes.first()
+        own_recipe = viewer.recipes.order_by('id').first()
+        author = User.objects.exclude(id=viewer.id).exclude(
+            following__user=viewer
+        ).order_by('id').first()
+        ingredient = Ingredient.objects.order_by('id').first()
+        tag = Tag.objects.order_by('id').first()
+        if None in (recipe, own_recipe, author, ingredient, tag):
+            raise CommandError('Недостаточно данных, запустите seed_data.')
+        return {
+            'recipe': recipe.id,
+            'own_recipe': own_recipe.id,
+            'bulk': list(free_recipes.values_list('id', flat=True)[:10]),
+            'author': author.id,
+            'ingredient': ingredient.id,
+            'prefix': ingredient.name[:2],
+            'tag': tag.slug,
+            'tag_id': tag.id,
+            'word': recipe.name.split()[0],
+            'feed': self.get_feed_cursor(viewer),
+            'ingredients': ','.join(
+                str(ingredient_id)
+                for ingredient_id in recipe.ingredients.values_list(
+                    'id', flat=True
+                )
+            ),
+        }
+
+    def get_feed_cursor(self, viewer):
+        """Курсор второй страницы ленты подписок зрителя."""
+        client = APIClient(SERVER_NAME='localhost')
+        client.force_authenticate(viewer)
+        next_link = client.get('/api/recipes/feed/').json()['next']
+        if next_link is None:
+            raise CommandError(
+                'Лента подписок пуста, запустите rebuild_feeds.'
+            )
+        return parse_qs(urlparse(next_link).query)['cursor'][0]
+
+    def run_scenario(self, client, name, method, path, data, status,
+                     max_queries, iterations):
+        timings = []
+        queries = 0
+        response_status = None
+        # Первый запрос прогревает кэши и в замеры не входит.
+        request_path, restore = self.prepare_state(client, method, path, data)
+        self.restore_state(
+            name, restore,
+            getattr(client, method)(request_path, data, format='json'),
+        )
+        for _ in range(iterations):
+            request_path, restore = self.prepare_state(
+                client, method, path, data
+            )
+            with CaptureQueriesContext(connection) as context:
+                started = time.perf_counter()
+                response = getattr(client, method)(
+                    request_path, data, format='json'
+                )
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                timings.append((time.perf_counter() - started) * 1000)
+            queries = max(queries, len(context.captured_queries))
+            response_status = response.status_code
+            self.restore_state(name, restore, response)
+        return {
+            'name': name,
+            'method': method.upper(),
+            'path': request_path,
+            'status': response_status,
+            'queries': queries,
+            'max_queries': max_queries,
+            'p50_ms': round(percentile(timings, 50), 3),
+            'p90_ms': round(percentile(timings, 90), 3),
+            'p99_ms': round(percentile(timings, 99), 3),
+            'failed': response_status != status or queries > max_queries,
+        }
+
+    def prepare_state(self, client, method, path, data):
+        """Готовит данные для пишущего сценария.
+
+        Возвращает адрес запроса и функцию, которая по ответу возвращает
+        базу в исходное состояние.
+        """
+        if '{created}' in path:
+            response = client.post(
+                '/api/recipes/', recipe_payload(self.params), format='json'
+            )
+            return path.format(created=response.data['id']), ignore_response
+        if method == 'delete':
+            client.post(path, data, format='json')
+            return path, ignore_response
+        if method == 'post':
+            if path == '/api/recipes/':
+                return path, delete_created_recipe(client)
+            return path, lambda response: client.delete(
+                path, data, format='json'
+            )
+        if method == 'put':
+            return path, self.put_back(client, path)
+        if method == 'patch':
+            return path, self.patch_back(client, path)
+        return path, ignore_response
+
+    def restore_state(self, name, restore, response):
+        restored = restore(response)
+        if restored is not None and restored.status_code >= 400:
+            raise CommandError(
+                f'Не удалось вернуть данные после сценария {name}.'
+            )
+
+    def put_back(self, client, path):
+        """Возвращает прежний набор рецептов после массовой замены."""
+        model = Favorite if path.endswith('/favorite/') else ShoppingCart
+        recipe_ids = list(model.objects.filter(
+            user=self.viewer
+        ).values_list('recipe_id', flat=True))
+        return lambda response: client.put(
+            path, {'recipes': recipe_ids}, format='json'
+        )
+
+    def patch_back(self, client, path):
+        """Возвращает прежние название и состав рецепта."""
+        recipe = Recipe.objects.get(id=self.params['own_recipe'])
+        original = {
+            'name': recipe.name,
+            'ingredients': [
+                {'id': ingredient_id, 'amount': amount}
+                for ingredient_id, amount
+                in recipe.ingridients_recipe.values_list(
+                    'ingredient_id', 'amount'
+                )
+            ],
+        }
+        return lambda response: client.patch(path, original, format='json')
+
+
+def ignore_response(response):
+    pass
+
+
+def delete_created_recipe(client):
+    return lambda response: client.delete(
+        f'/api/recipes/{response.data["id"]}/'
+    )
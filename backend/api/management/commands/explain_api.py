@@ -0,0 +1,82 @@
+from django.core.management.base import CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from .benchmark_api import SCENARIOS
+from .benchmark_api import Command as BenchmarkCommand
+
+
+class Command(BenchmarkCommand):
+    help = (
+        'Выполняет сценарии benchmark_api и печатает план каждого '
+        'SELECT-запроса: EXPLAIN ANALYZE на PostgreSQL, EXPLAIN QUERY PLAN '
+        'на SQLite.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--viewer', help='email пользователя-зрителя.')
+        parser.add_argument(
+            '--scenario', action='append',
+            help='Название сценария, можно указать несколько раз.',
+        )
+
+    def handle(self, *args, **options):
+        names = options['scenario']
+        known = {scenario[0] for scenario in SCENARIOS}
+        if names and set(names) - known:
+            raise CommandError(
+                'Неизвестные сценарии: '
+                + ', '.join(sorted(set(names) - known))
+            )
+        viewer = self.get_viewer(options['viewer'])
+        params = self.get_params(viewer)
+        client = APIClient(SERVER_NAME='localhost')
+        client.force_authenticate(viewer)
+        anonymous = APIClient(SERVER_NAME='localhost')
+
+        for name, method, path, status, max_queries in SCENARIOS:
+            if names and name not in names:
+                continue
+            path = path.format(**params)
+            if method == 'anonymous':
+                method, scenario_client = 'get', anonymous
+            else:
+                scenario_client = client
+            self.prepare_state(scenario_client, method, path)
+            with CaptureQueriesContext(connection) as context:
+                getattr(scenario_client, method)(path)
+            # Следующий запрос к API очистит журнал соединения.
+            queries = context.captured_queries
+            self.restore_state(scenario_client, method, path)
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f'{name}: {method.upper()} {path}'
+            ))
+            for query in queries:
+                sql = query['sql']
+                if not sql.lstrip().upper().startswith(('SELECT', 'WITH')):
+                    continue
+                self.stdout.write(f'  {sql}')
+                for line in self.explain(sql):
+                    self.stdout.write(f'    {line}')
+
+    def explain(self, sql):
+        """Строки плана запроса."""
+        vendor = connection.vendor
+        # EXPLAIN ANALYZE выполняет запрос, поэтому всё откатывается.
+        with transaction.atomic(), connection.cursor() as cursor:
+            if vendor == 'postgresql':
+                cursor.execute(f'EXPLAIN (ANALYZE, BUFFERS) {sql}')
+                lines = [row[0] for row in cursor.fetchall()]
+            elif vendor == 'sqlite':
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                depth = {0: 0}
+                lines = []
+                for node, parent, _, detail in cursor.fetchall():
+                    depth[node] = depth.get(parent, 0) + 1
+                    lines.append('  ' * (depth[node] - 1) + detail)
+            else:
+                cursor.execute(f'EXPLAIN {sql}')
+                lines = [' '.join(map(str, row)) for row in cursor.fetchall()]
+            transaction.set_rollback(True)
+        return lines
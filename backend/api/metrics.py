@@ -0,0 +1,144 @@
+"""Гистограммы обработки запросов в формате Prometheus.
+
+Каждый процесс копит значения в памяти и не реже раза в
+METRICS_FLUSH_INTERVAL секунд сохраняет их в файл METRICS_DIR/<pid>.json.
+Адрес /api/metrics/ складывает файлы всех воркеров gunicorn, поэтому
+Prometheus видит сумму по контейнеру, к какому бы воркеру ни попал.
+"""
+import glob
+import json
+import logging
+import os
+import time
+from bisect import bisect_left
+from threading import Lock
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+logger = logging.getLogger(__name__)
+
+PREFIX = 'foodgram_'
+DURATION_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+QUERY_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100)
+HISTOGRAMS = {
+    'request_duration_seconds': (
+        'Время обработки запроса.', DURATION_BUCKETS,
+    ),
+    'db_duration_seconds': (
+        'Время SQL-запросов за запрос.', DURATION_BUCKETS,
+    ),
+    'db_queries': ('Число SQL-запросов за запрос.', QUERY_BUCKETS),
+    'serialize_duration_seconds': (
+        'Время сериализации ответа.', DURATION_BUCKETS,
+    ),
+    'render_duration_seconds': (
+        'Время рендеринга ответа.', DURATION_BUCKETS,
+    ),
+}
+
+
+class MetricsRegistry:
+    """Гистограммы процесса по маршруту и методу запроса.
+
+    Значение гистограммы — список: число наблюдений в каждом интервале
+    (последний — выше всех границ), сумма и общее число наблюдений.
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.values = {}
+        self.flushed = time.monotonic()
+
+    def observe(self, name, route, method, value):
+        buckets = HISTOGRAMS[name][1]
+        key = '|'.join([name, route, method])
+        with self.lock:
+            counts = self.values.setdefault(key, [0] * (len(buckets) + 3))
+            counts[bisect_left(buckets, value)] += 1
+            counts[-2] += value
+            counts[-1] += 1
+
+    def observe_request(self, route, method, values):
+        for name, value in values.items():
+            self.observe(name, route, method, value)
+        if time.monotonic() - self.flushed >= settings.METRICS_FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        self.flushed = time.monotonic()
+        with self.lock:
+            content = json.dumps(self.values)
+        path = os.path.join(settings.METRICS_DIR, f'{os.getpid()}.json')
+        try:
+            os.makedirs(settings.METRICS_DIR, exist_ok=True)
+            with open(f'{path}.tmp', 'w') as file:
+                file.write(content)
+            os.replace(f'{path}.tmp', path)
+        except OSError:
+            logger.warning('Не удалось сохранить метрики в %s.', path,
+                           exc_info=True)
+
+    def collect(self):
+        """Сумма гистограмм всех процессов."""
+        self.flush()
+        total = {}
+        for path in glob.glob(os.path.join(settings.METRICS_DIR, '*.json')):
+            try:
+                with open(path) as file:
+                    values = json.load(file)
+            except (OSError, ValueError):
+                continue
+            for key, counts in values.items():
+                if key in total:
+                    total[key] = [a + b for a, b in zip(total[key], counts)]
+                else:
+                    total[key] = counts
+        return total
+
+
+registry = MetricsRegistry()
+
+
+def escape(value):
+    return (
+        value.replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+    )
+
+
+def render_metrics(values):
+    """Текстовый формат Prometheus."""
+    lines = []
+    series = sorted(key.split('|') + [key] for key in values)
+    for name, (help_text, buckets) in HISTOGRAMS.items():
+        metric = PREFIX + name
+        lines.append(f'# HELP {metric} {help_text}')
+        lines.append(f'# TYPE {metric} histogram')
+        for series_name, route, method, key in series:
+            if series_name != name:
+                continue
+            counts = values[key]
+            labels = f'route="{escape(route)}",method="{escape(method)}"'
+            cumulative = 0
+            for bound, count in zip(buckets + ('+Inf',), counts):
+                cumulative += count
+                lines.append(
+                    f'{metric}_bucket{{{labels},le="{bound}"}} {cumulative}'
+                )
+            lines.append(f'{metric}_sum{{{labels}}} {counts[-2]}')
+            lines.append(f'{metric}_count{{{labels}}} {counts[-1]}')
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    """Метрики для Prometheus. Если задан METRICS_TOKEN, нужен заголовок
+    Authorization: Bearer <токен>."""
+    token = settings.METRICS_TOKEN
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return HttpResponseForbidden()
+    return HttpResponse(
+        render_metrics(registry.collect()),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
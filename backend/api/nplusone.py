@@ -0,0 +1,81 @@
+"""Поиск N+1 в запросах API.
+
+При NPLUSONE_DETECTION каждый SQL-запрос сводится к форме без значений
+параметров. Если запрос одной формы выполнен больше NPLUSONE_THRESHOLD
+раз за запрос API, в лог пишется его форма, поле сериализатора, из
+которого он пришёл, и стек проекта, а при NPLUSONE_RAISE запрос падает
+с NPlusOneError — так N+1 роняет тесты API (оба флага включены в
+api.tests.base) и benchmark_api --nplusone.
+"""
+import inspect
+import logging
+import re
+import traceback
+from collections import Counter
+
+from django.conf import settings
+from rest_framework.fields import Field
+from rest_framework.serializers import BaseSerializer
+
+logger = logging.getLogger(__name__)
+
+LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+PLACEHOLDER_LISTS = re.compile(r'\?(?:\s*,\s*\?)+')
+
+
+class NPlusOneError(Exception):
+    """Запрос API выполнил много SQL-запросов одной формы."""
+
+
+def fingerprint(sql):
+    """Форма запроса: значения и списки параметров заменены на ?."""
+    sql = LITERALS.sub('?', sql.replace('%s', '?'))
+    return ' '.join(PLACEHOLDER_LISTS.sub('?, ...', sql).split())
+
+
+def find_origin():
+    """Поле сериализатора, которое выполняет запрос, и стек проекта."""
+    field = serializer = None
+    frame = inspect.currentframe()
+    while frame is not None and field is None:
+        obj = frame.f_locals.get('self')
+        if isinstance(obj, BaseSerializer):
+            if serializer is None:
+                serializer = f'{type(obj).__name__}.{frame.f_code.co_name}'
+        elif isinstance(obj, Field) and obj.field_name and obj.parent:
+            field = f'{type(obj.parent).__name__}.{obj.field_name}'
+        frame = frame.f_back
+    base_dir = str(settings.BASE_DIR)
+    stack = [
+        entry for entry in traceback.extract_stack()
+        if entry.filename.startswith(base_dir)
+        and 'site-packages' not in entry.filename
+        and not entry.filename.endswith(('nplusone.py', 'timing.py'))
+    ]
+    return field or serializer, ''.join(traceback.format_list(stack))
+
+
+class QueryFingerprints:
+    """Счётчик SQL-запросов одной формы за время запроса API."""
+
+    def __init__(self):
+        self.counts = Counter()
+        self.origins = {}
+
+    def record(self, sql):
+        key = fingerprint(sql)
+        self.counts[key] += 1
+        if self.counts[key] == settings.NPLUSONE_THRESHOLD + 1:
+            self.origins[key] = find_origin()
+
+    def report(self, route):
+        if not self.origins:
+            return
+        message = f'N+1 в {route}:\n' + '\n'.join(
+            f'{self.counts[key]} раз: {key}\n'
+            f'поле: {origin or "вне сериализатора"}\n{stack}'
+            for key, (origin, stack) in self.origins.items()
+        )
+        if settings.NPLUSONE_RAISE:
+            raise NPlusOneError(message)
+        logger.warning(message)
@@ -1,9 +1,175 @@
+import base64
+import binascii
+import json
+from collections import OrderedDict
+from operator import attrgetter
+
 from django.conf import settings
+from django.db import connections
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def approximate_count(queryset):
+    """Оценка числа строк по плану запроса PostgreSQL.
+
+    На других СУБД выполняется обычный COUNT(*).
+    """
+    queryset = queryset.order_by()
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+        return cursor.fetchone()[0][0]['Plan']['Plan Rows']
+
+
+def parse_cursor_int(value):
+    if type(value) is not int or abs(value) >= 2 ** 63:
+        raise ValueError(value)
+    return value
+
+
+def parse_cursor_number(value):
+    if type(value) is float:
+        return value
+    return parse_cursor_int(value)
+
+
+def parse_cursor_string(value):
+    if not isinstance(value, str):
+        raise ValueError(value)
+    return value
+
+
+def parse_cursor_datetime(value):
+    value = parse_datetime(parse_cursor_string(value))
+    if value is None:
+        raise ValueError(value)
+    return value
+
+
+# Разбор значений курсора по полю сортировки; остальные поля — целые.
+CURSOR_VALUE_PARSERS = {
+    'pub_date': parse_cursor_datetime,
+    'username': parse_cursor_string,
+    'rank': parse_cursor_number,
+}
 
 
 class CustomPagination(PageNumberPagination):
-    """Кастомный паджинатор."""
+    """Кастомный паджинатор.
+
+    По умолчанию постраничный. Если в запросе передан параметр cursor
+    (пустой для первой страницы), выдача идёт по ключу сортировки
+    представления (cursor_ordering) без OFFSET и точного COUNT(*).
+    """
 
     page_size_query_param = 'limit'
     page_size = settings.PAGINATION_SIZE
+    cursor_query_param = 'cursor'
+    cursor_ordering = ('-pub_date', '-id')
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.use_cursor = self.cursor_query_param in request.query_params
+        if not self.use_cursor:
+            return super().paginate_queryset(queryset, request, view)
+        self.request = request
+        self.ordering = getattr(view, 'cursor_ordering', self.cursor_ordering)
+        limit = self.get_page_size(request)
+        position, reverse = self.decode_cursor(request)
+        self.count = approximate_count(queryset)
+
+        ordering = self.ordering
+        if reverse:
+            ordering = [self.invert(field) for field in ordering]
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(self.keyset_filter(ordering, position))
+        results = list(queryset[:limit + 1])
+        has_more = len(results) > limit
+        results = results[:limit]
+        if reverse:
+            results.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, position is not None
+        self.next_position = self.previous_position = None
+        if results and has_next:
+            self.next_position = self.get_position(results[-1])
+        if results and has_previous:
+            self.previous_position = self.get_position(results[0])
+        return results
+
+    def get_paginated_response(self, data):
+        if not self.use_cursor:
+            return super().get_paginated_response(data)
+        return Response(OrderedDict([
+            ('count', self.count),
+            ('next', self.get_cursor_link(self.next_position, False)),
+            ('previous', self.get_cursor_link(self.previous_position, True)),
+            ('results', data),
+        ]))
+
+    @staticmethod
+    def invert(field):
+        return field[1:] if field.startswith('-') else f'-{field}'
+
+    def keyset_filter(self, ordering, position):
+        """Условие «строго после позиции» для составного ключа."""
+        condition = Q()
+        for index, field in enumerate(ordering):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            step = Q(**{f'{name}__{lookup}': position[index]})
+            for previous, value in zip(ordering[:index], position):
+                step &= Q(**{previous.lstrip('-'): value})
+            condition |= step
+        return condition
+
+    def get_position(self, instance):
+        position = []
+        for field in self.ordering:
+            value = attrgetter(field.lstrip('-').replace('__', '.'))(instance)
+            position.append(
+                value.isoformat() if hasattr(value, 'isoformat') else value
+            )
+        return position
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            position, reverse = cursor['p'], bool(cursor['r'])
+            if not isinstance(position, list) or (
+                len(position) != len(self.ordering)
+            ):
+                raise ValueError(position)
+            position = [
+                CURSOR_VALUE_PARSERS.get(
+                    field.lstrip('-'), parse_cursor_int
+                )(value)
+                for field, value in zip(self.ordering, position)
+            ]
+        except (TypeError, ValueError, KeyError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+    def get_cursor_link(self, position, reverse):
+        if position is None:
+            return None
+        encoded = base64.urlsafe_b64encode(
+            json.dumps({'p': position, 'r': int(reverse)}).encode()
+        ).decode()
+        url = remove_query_param(
+            self.request.build_absolute_uri(), self.page_query_param
+        )
+        return replace_query_param(url, self.cursor_query_param, encoded)
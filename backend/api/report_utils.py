@@ -1,24 +1,171 @@
-from django.db.models import Sum
-from django.http import HttpResponse
+import csv
+from io import BytesIO
+
+from django.conf import settings
+from django.db.models import (Case, CharField, ExpressionWrapper, F,
+                              FloatField, Sum, Value, When)
+from django.http import StreamingHttpResponse
+from rest_framework import status
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+
+from recipes.models import ShoppingCartIngredient
+
+# Единицы измерения, которые приводятся к базовой: кг -> г, л -> мл.
+UNIT_CONVERSIONS = {
+    'кг': 'г',
+    'л': 'мл',
+}
+BASE_UNITS = {base: larger for larger, base in UNIT_CONVERSIONS.items()}
+UNIT_FACTOR = 1000
+
+ITERATOR_CHUNK_SIZE = 500
+
+
+def shopping_cart_totals(user):
+    """Суммы ингредиентов из списка покупок с приведёнными единицами.
+
+    Суммы читаются из сводной таблицы ShoppingCartIngredient, пересчёт
+    единиц и выбор крупной единицы для вывода выполняются в запросе,
+    строки отдаются итератором без загрузки всего списка.
+    """
+    totals = ShoppingCartIngredient.objects.filter(user=user).annotate(
+        unit=Case(
+            *[
+                When(ingredient__measurement_unit=larger, then=Value(base))
+                for larger, base in UNIT_CONVERSIONS.items()
+            ],
+            default=F('ingredient__measurement_unit'),
+            output_field=CharField(),
+        ),
+        base_amount=Case(
+            When(
+                ingredient__measurement_unit__in=list(UNIT_CONVERSIONS),
+                then=F('amount') * UNIT_FACTOR,
+            ),
+            default=F('amount'),
+        ),
+    ).values('ingredient__name', 'unit').annotate(
+        amount_sum=Sum('base_amount')
+    )
+    amount_sum = ExpressionWrapper(
+        F('amount_sum') * 1.0, output_field=FloatField()
+    )
+    return totals.annotate(
+        display_unit=Case(
+            *[
+                When(
+                    unit=base, amount_sum__gte=UNIT_FACTOR,
+                    then=Value(larger),
+                )
+                for base, larger in BASE_UNITS.items()
+            ],
+            default=F('unit'),
+            output_field=CharField(),
+        ),
+        display_amount=Case(
+            When(
+                unit__in=list(BASE_UNITS), amount_sum__gte=UNIT_FACTOR,
+                then=ExpressionWrapper(
+                    amount_sum / UNIT_FACTOR, output_field=FloatField()
+                ),
+            ),
+            default=amount_sum,
+            output_field=FloatField(),
+        ),
+    ).order_by('ingredient__name', 'unit').iterator(
+        chunk_size=ITERATOR_CHUNK_SIZE
+    )
+
+
+def format_amount(amount):
+    return f'{amount:g}'
+
+
+def render_text(rows):
+    for row in rows:
+        yield (
+            f'* {row["ingredient__name"]} ({row["display_unit"]})'
+            f' - {format_amount(row["display_amount"])}\n'
+        )
+
+
+class Echo:
+    """Псевдобуфер, возвращающий записанную строку вместо её хранения."""
+
+    def write(self, value):
+        return value
+
+
+def render_csv(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(['Ингредиент', 'Единица измерения', 'Количество'])
+    for row in rows:
+        yield writer.writerow([
+            row['ingredient__name'],
+            row['display_unit'],
+            format_amount(row['display_amount']),
+        ])
+
+
+def render_pdf(rows):
+    """PDF собирается целиком: формат требует таблицу смещений в конце."""
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+    from reportlab.pdfgen import canvas
+
+    pdfmetrics.registerFont(
+        TTFont('ShoppingListFont', settings.SHOPPING_LIST_PDF_FONT)
+    )
+    buffer = BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=A4)
+    width, height = A4
+    margin, line_height = 50, 18
+    y = height - margin
+    pdf.setFont('ShoppingListFont', 16)
+    pdf.drawString(margin, y, 'Список покупок')
+    y -= line_height * 2
+    pdf.setFont('ShoppingListFont', 12)
+    for row in rows:
+        if y < margin:
+            pdf.showPage()
+            pdf.setFont('ShoppingListFont', 12)
+            y = height - margin
+        pdf.drawString(
+            margin, y,
+            f'• {row["ingredient__name"]} ({row["display_unit"]})'
+            f' — {format_amount(row["display_amount"])}'
+        )
+        y -= line_height
+    pdf.save()
+    yield buffer.getvalue()
+
 
-from recipes.models import IngredientRecipe
+EXPORT_FORMATS = {
+    'txt': (render_text, 'text/plain; charset=utf-8'),
+    'csv': (render_csv, 'text/csv; charset=utf-8'),
+    'pdf': (render_pdf, 'application/pdf'),
+}
 
 
 @action(
     detail=False, permission_classes=[IsAuthenticated]
 )
 def download_shopping_cart(self, request):
-    ingredients = IngredientRecipe.objects.filter(
-        recipe__shopping_cart__user=request.user
-    ).values(
-        'ingredient__name',
-        'ingredient__measurement_unit'
-    ).annotate(amount_sum=Sum('amount'))
-    shop_list = '\n'.join([
-        f'* {row["ingredient__name"]} '
-        f'({row["ingredient__measurement_unit"]})'
-        f' - {row["amount_sum"]}'
-        for row in ingredients])
-    return HttpResponse(shop_list, content_type='text/plain')
+    export_format = request.query_params.get('type', 'txt')
+    if export_format not in EXPORT_FORMATS:
+        return Response(
+            {'errors': 'Доступные форматы: ' + ', '.join(EXPORT_FORMATS)},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    render, content_type = EXPORT_FORMATS[export_format]
+    response = StreamingHttpResponse(
+        render(shopping_cart_totals(request.user)),
+        content_type=content_type,
+    )
+    response['Content-Disposition'] = (
+        f'attachment; filename="shopping_list.{export_format}"'
+    )
+    return response
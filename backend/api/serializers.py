@@ -1,18 +1,29 @@
+from collections import OrderedDict
+
+from django.conf import settings
 from django.db.transaction import atomic
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import status
-from rest_framework.serializers import (IntegerField, ModelSerializer,
-                                        PrimaryKeyRelatedField,
+from rest_framework.serializers import (IntegerField, ListField,
+                                        ListSerializer, ModelSerializer,
+                                        PrimaryKeyRelatedField, Serializer,
                                         SerializerMethodField,
                                         SlugRelatedField, ValidationError)
 
-from recipes.models import (Favorite, Ingredient, IngredientRecipe, Recipe,
-                            ShoppingCart, Tag)
+from recipes.images import schedule_recipe_image
+from recipes.models import (Favorite, FeedEntry, Ingredient, IngredientRecipe,
+                            Recipe, ShoppingCart, ShoppingCartIngredient, Tag)
+from recipes.search import update_search_index
 from users.models import Follow, User
 
+from .caching import (batch_invalidations, get_recipe_documents,
+                      invalidate_recipe_documents)
+from .fields import DeferredBase64ImageField, ImageRenditionsField
+from .timing import TimedSerializerMixin, timed
+
 
-class UsersSerializer(UserSerializer):
+class UsersSerializer(TimedSerializerMixin, UserSerializer):
     """Сериализатор для отображения информации о пользователях."""
 
     is_subscribed = SerializerMethodField(read_only=True)
@@ -29,6 +40,8 @@ class UsersSerializer(UserSerializer):
         ]
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         user = self.context.get('request').user
         return (
             user.is_authenticated
@@ -64,7 +77,7 @@ class UserRegistrationSerializer(UserCreateSerializer):
         return user
 
 
-class IngredientSerializer(ModelSerializer):
+class IngredientSerializer(TimedSerializerMixin, ModelSerializer):
     """Сериализатор для ингредиентов."""
 
     class Meta:
@@ -72,7 +85,7 @@ class IngredientSerializer(ModelSerializer):
         fields = ['id', 'name', 'measurement_unit']
 
 
-class TagSerializer(ModelSerializer):
+class TagSerializer(TimedSerializerMixin, ModelSerializer):
     """Сериализатор для тегов."""
 
     class Meta:
@@ -90,14 +103,15 @@ class CreateRecipeIngredientSerializer(ModelSerializer):
         fields = ['id', 'amount']
 
 
-class ShortRecipeSerializer(ModelSerializer):
+class ShortRecipeSerializer(TimedSerializerMixin, ModelSerializer):
     """Сериализатор для отображения рецептов на странице подписок."""
 
     image = Base64ImageField()
+    image_renditions = ImageRenditionsField()
 
     class Meta:
         model = Recipe
-        fields = ['id', 'name', 'image', 'cooking_time']
+        fields = ['id', 'name', 'image', 'image_renditions', 'cooking_time']
 
 
 class IngredientRecipeSerializer(ModelSerializer):
@@ -115,33 +129,114 @@ class IngredientRecipeSerializer(ModelSerializer):
         fields = ['id', 'name', 'measurement_unit', 'amount']
 
 
-class RecipeSerializer(ModelSerializer):
-    """Сериализатор для отображения рецептов."""
+class RecipeAuthorSerializer(ModelSerializer):
+    """Автор в документе рецепта, без флага подписки."""
+
+    class Meta:
+        model = User
+        fields = ['email', 'id', 'username', 'first_name', 'last_name']
+
+
+class RecipeDocumentSerializer(ModelSerializer):
+    """Часть рецепта, одинаковая для всех пользователей и хранимая в кэше:
+    теги, автор и ингредиенты."""
 
     tags = TagSerializer(many=True, read_only=True)
+    author = RecipeAuthorSerializer(read_only=True)
     ingredients = IngredientRecipeSerializer(
         many=True, read_only=True, source='ingridients_recipe'
     )
-    author = UsersSerializer(read_only=True)
+
+    class Meta:
+        model = Recipe
+        fields = ['tags', 'author', 'ingredients']
+
+
+def build_recipe_documents(recipe_ids):
+    """Документы рецептов {id: документ} фиксированным числом запросов."""
+    return {
+        recipe.id: RecipeDocumentSerializer(recipe).data
+        for recipe in Recipe.objects.filter(id__in=recipe_ids).with_related()
+    }
+
+
+class RecipeListSerializer(ListSerializer):
+    """Берёт документы всех рецептов списка одним обращением к кэшу."""
+
+    def to_representation(self, data):
+        recipes = list(data)
+        with timed('serialize'):
+            documents = get_recipe_documents(
+                recipes, build_recipe_documents
+            )
+            for recipe in recipes:
+                recipe.document = documents.get(recipe.id)
+            return super().to_representation(recipes)
+
+
+class RecipeSerializer(ModelSerializer):
+    """Сериализатор для отображения рецептов.
+
+    Теги, автор и ингредиенты берутся из закэшированного документа
+    рецепта, поля самого рецепта и флаги пользователя — из запроса.
+    """
+
     is_in_shopping_cart = SerializerMethodField(read_only=True)
     is_favorited = SerializerMethodField(read_only=True)
+    image_renditions = ImageRenditionsField()
 
     class Meta:
         model = Recipe
+        list_serializer_class = RecipeListSerializer
         fields = [
             'id',
-            'tags',
-            'author',
-            'ingredients',
             'is_favorited',
             'is_in_shopping_cart',
             'name',
             'image',
+            'image_renditions',
             'text',
             'cooking_time',
+            'favorites_count',
+            'in_carts_count',
         ]
+        read_only_fields = ['favorites_count', 'in_carts_count']
+
+    def to_representation(self, instance):
+        with timed('serialize'):
+            document = getattr(instance, 'document', None)
+            if document is None:
+                document = get_recipe_documents(
+                    [instance], build_recipe_documents
+                ).get(instance.id)
+            if document is None:
+                # Рецепт удалили после выборки страницы: документ строится
+                # по самому объекту и в кэш не кладётся.
+                document = RecipeDocumentSerializer(instance).data
+            data = super().to_representation(instance)
+            representation = OrderedDict([('id', data.pop('id'))])
+            representation.update(document)
+            representation['author'] = OrderedDict(
+                document['author'],
+                is_subscribed=self.get_is_subscribed(instance),
+            )
+            representation.update(data)
+            return representation
+
+    def get_is_subscribed(self, obj):
+        if hasattr(obj, 'author_is_subscribed'):
+            return obj.author_is_subscribed
+        user = self.context.get('request').user
+        return (
+            user.is_authenticated
+            and Follow.objects.filter(
+                user=user, author_id=obj.author_id
+            ).exists()
+        )
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         user = self.context.get('request').user
         return (
             user.is_authenticated
@@ -149,6 +244,8 @@ class RecipeSerializer(ModelSerializer):
         )
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         user = self.context.get('request').user
         return (
             user.is_authenticated
@@ -156,6 +253,19 @@ class RecipeSerializer(ModelSerializer):
         )
 
 
+class CookableRecipeSerializer(RecipeSerializer):
+    """Сериализатор рецептов с покрытием имеющимися ингредиентами."""
+
+    matched_count = IntegerField(read_only=True)
+    missing_count = IntegerField(read_only=True)
+
+    class Meta(RecipeSerializer.Meta):
+        fields = RecipeSerializer.Meta.fields + [
+            'matched_count',
+            'missing_count',
+        ]
+
+
 class CreateRecipeSerializer(ModelSerializer):
     """Сериализатор для создания и обновления рецептов."""
 
@@ -163,7 +273,7 @@ class CreateRecipeSerializer(ModelSerializer):
     tags = PrimaryKeyRelatedField(queryset=Tag.objects.all(), many=True)
     ingredients = CreateRecipeIngredientSerializer(many=True)
     cooking_time = IntegerField()
-    image = Base64ImageField(use_url=True)
+    image = DeferredBase64ImageField(use_url=True)
 
     class Meta:
         model = Recipe
@@ -220,33 +330,128 @@ class CreateRecipeSerializer(ModelSerializer):
         )
 
     @atomic
+    @batch_invalidations()
     def create(self, validated_data):
         request = self.context.get('request')
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
+        image = validated_data.pop('image')
         recipe = Recipe.objects.create(author=request.user, **validated_data)
         self.create_ingredients(recipe, ingredients)
         recipe.tags.set(tags)
+        if image:
+            schedule_recipe_image(recipe, image)
+        update_search_index([recipe.id])
+        FeedEntry.objects.fan_out(recipe)
         return recipe
 
+    def update_ingredients(self, recipe, ingredients):
+        """Применяет к составу рецепта только разницу со старым составом.
+
+        Возвращает True, если состав изменился.
+        """
+        existing = {
+            row.ingredient_id: row for row in recipe.ingridients_recipe.all()
+        }
+        old_amounts = {
+            ingredient_id: row.amount
+            for ingredient_id, row in existing.items()
+        }
+        new_amounts = {row['id']: row['amount'] for row in ingredients}
+        if new_amounts == old_amounts:
+            return False
+        removed = [
+            row.id for ingredient_id, row in existing.items()
+            if ingredient_id not in new_amounts
+        ]
+        changed = []
+        for ingredient_id, amount in new_amounts.items():
+            row = existing.get(ingredient_id)
+            if row is not None and row.amount != amount:
+                row.amount = amount
+                changed.append(row)
+        if removed:
+            IngredientRecipe.objects.filter(id__in=removed).delete()
+        if changed:
+            IngredientRecipe.objects.bulk_update(changed, ['amount'])
+        self.create_ingredients(recipe, [
+            row for row in ingredients if row['id'] not in existing
+        ])
+        ShoppingCartIngredient.objects.change_recipe(
+            recipe.id, old_amounts, new_amounts
+        )
+        return True
+
     @atomic
+    @batch_invalidations()
     def update(self, instance, validated_data):
-        ingredients = validated_data.pop('ingredients')
-        IngredientRecipe.objects.filter(recipe=instance).delete()
-        self.create_ingredients(instance, ingredients)
-        return super().update(instance, validated_data)
+        """Записывает только изменившиеся поля, состав и теги.
+
+        При частичном обновлении (PATCH) не переданные поля не трогаются.
+        """
+        ingredients = validated_data.pop('ingredients', None)
+        tags = validated_data.pop('tags', None)
+        image = validated_data.pop('image', None)
+        reindex = ingredients is not None and self.update_ingredients(
+            instance, ingredients
+        )
+        if tags is not None and (
+            {tag.id for tag in instance.tags.all()}
+            != {tag.id for tag in tags}
+        ):
+            instance.tags.set(tags)
+        if image:
+            schedule_recipe_image(instance, image)
+        changed = [
+            name for name, value in validated_data.items()
+            if getattr(instance, name) != value
+        ]
+        for name in changed:
+            setattr(instance, name, validated_data[name])
+        if changed:
+            instance.save(update_fields=changed)
+        if reindex:
+            # Состав меняется пакетными запросами, которые не шлют сигналы.
+            invalidate_recipe_documents([instance.id])
+        if reindex or {'name', 'text'} & set(changed):
+            update_search_index([instance.id])
+        return instance
 
     def to_representation(self, instance):
+        # Версию документа подняли запросом или сигналом в обход объекта.
+        instance.refresh_from_db(fields=['document_version'])
         return RecipeSerializer(
             instance, context={'request': self.context.get('request')}
         ).data
 
 
-class FollowSerializer(ModelSerializer):
+class BulkRecipesSerializer(Serializer):
+    """Список id рецептов для массового добавления в избранное
+    или список покупок."""
+
+    recipes = ListField(
+        child=IntegerField(min_value=1),
+        max_length=settings.BULK_RECIPES_MAX,
+    )
+
+    def validate_recipes(self, value):
+        # Пустой список допустим только при замене: он очищает набор.
+        if not value and self.context['request'].method != 'PUT':
+            raise ValidationError('Передайте id рецептов.')
+        return list(dict.fromkeys(value))
+
+
+def get_recipes_limit(request):
+    """Значение параметра recipes_limit или None, если он не задан."""
+    limit = request.query_params.get('recipes_limit', '')
+    return int(limit) if limit.isdecimal() else None
+
+
+class FollowSerializer(TimedSerializerMixin, ModelSerializer):
     """Сериализатор для подписок."""
 
     recipes = SerializerMethodField()
-    recipes_count = IntegerField(source='recipes.count', read_only=True)
+    recipes_count = SerializerMethodField(read_only=True)
     is_subscribed = SerializerMethodField(read_only=True)
 
     class Meta:
@@ -264,6 +469,8 @@ class FollowSerializer(ModelSerializer):
         read_only_fields = ['email', 'username']
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         user = self.context.get('request').user
         return (
             user.is_authenticated
@@ -271,25 +478,24 @@ class FollowSerializer(ModelSerializer):
         )
 
     def get_recipes(self, obj):
-        request = self.context.get('request')
-        limit = request.query_params.get('recipes_limit')
-        recipes = obj.recipes.all()
-        if limit:
-            recipes = recipes[:int(limit)]
+        if hasattr(obj, 'latest_recipes'):
+            recipes = obj.latest_recipes
+        else:
+            limit = get_recipes_limit(self.context.get('request'))
+            recipes = obj.recipes.all()[:limit]
         serializer = ShortRecipeSerializer(
             recipes, many=True, read_only=True
         )
         return serializer.data
 
+    def get_recipes_count(self, obj):
+        if hasattr(obj, 'recipes_count'):
+            return obj.recipes_count
+        return obj.recipes.count()
+
     def validate(self, data):
+        # Повторная подписка отсекается уникальным ограничением при вставке.
         user = self.context.get('request').user
-        check_sub = Follow.objects.filter(author=self.instance,
-                                          user=user).exists()
-        if check_sub:
-            raise ValidationError(
-                detail='Подписка уже есть.',
-                code=status.HTTP_400_BAD_REQUEST
-            )
         if user == self.instance:
             raise ValidationError(
                 detail='Это ваш аккаунт.',
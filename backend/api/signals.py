@@ -0,0 +1,76 @@
+from django.core.signals import request_started
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from backend.db_router import close_unusable_connections
+from backend.versions import bump_version
+from recipes.models import Ingredient, IngredientRecipe, Recipe, Tag
+from users.models import User
+
+from .caching import invalidate_recipe_documents
+from .timing import record_query
+
+# Поля пользователя, которые входят в документ рецепта.
+AUTHOR_DOCUMENT_FIELDS = {'email', 'username', 'first_name', 'last_name'}
+
+
+@receiver([post_save, post_delete], sender=Tag)
+def bump_tags_version(sender, **kwargs):
+    bump_version('tags')
+    bump_version('recipe-documents')
+
+
+@receiver([post_save, post_delete], sender=Ingredient)
+def bump_ingredients_version(sender, **kwargs):
+    bump_version('ingredients')
+    bump_version('recipe-documents')
+
+
+@receiver(post_save, sender=Recipe)
+def invalidate_recipe_document(sender, instance, created, update_fields,
+                               **kwargs):
+    # Из полей самого рецепта в документ входит только автор.
+    if created or (update_fields and 'author' not in update_fields):
+        return
+    invalidate_recipe_documents([instance.id])
+
+
+@receiver([post_save, post_delete], sender=IngredientRecipe)
+def invalidate_ingredient_recipe_document(sender, instance, **kwargs):
+    invalidate_recipe_documents([instance.recipe_id])
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_tagged_recipe_documents(sender, instance, action, reverse,
+                                       pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        invalidate_recipe_documents([instance.id])
+    elif pk_set:
+        invalidate_recipe_documents(pk_set)
+    else:
+        bump_version('recipe-documents')
+
+
+@receiver(post_save, sender=User)
+def invalidate_author_documents(sender, instance, created, update_fields,
+                                **kwargs):
+    if created or (
+        update_fields and not AUTHOR_DOCUMENT_FIELDS & set(update_fields)
+    ):
+        return
+    invalidate_recipe_documents(instance.recipes.all())
+
+
+@receiver(request_started)
+def check_persistent_connections(sender, **kwargs):
+    close_unusable_connections()
+
+
+@receiver(connection_created)
+def install_query_recorder(sender, connection, **kwargs):
+    # Обёртка остаётся у соединения и при переподключении.
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
@@ -0,0 +1,77 @@
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from recipes.models import Ingredient, IngredientRecipe, Recipe, Tag
+from users.models import User
+
+TEST_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'default',
+    },
+    'recipe-documents': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'recipe-documents',
+    },
+}
+
+
+def clear_caches():
+    for alias in TEST_CACHES:
+        caches[alias].clear()
+
+
+# N+1 в запросе API роняет тест с NPlusOneError.
+NPLUSONE_SETTINGS = {'NPLUSONE_DETECTION': True, 'NPLUSONE_RAISE': True}
+
+
+@override_settings(CACHES=TEST_CACHES, DATABASE_REPLICAS=[],
+                   **NPLUSONE_SETTINGS)
+class APITestCase(TestCase):
+    """Пользователь с клиентом, автор, тег и ингредиенты для тестов API."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = cls.create_user('cook')
+        cls.author = cls.create_user('author')
+        cls.tag = Tag.objects.create(
+            name='Завтрак', color='#E26C2D', slug='breakfast'
+        )
+        cls.salt = Ingredient.objects.create(
+            name='соль', measurement_unit='г'
+        )
+        cls.flour = Ingredient.objects.create(
+            name='мука', measurement_unit='г'
+        )
+
+    @staticmethod
+    def create_user(username):
+        return User.objects.create_user(
+            email=f'{username}@example.com',
+            username=username,
+            first_name=username,
+            last_name=username,
+            password='Secret-password-1',
+        )
+
+    def setUp(self):
+        clear_caches()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_recipe(self, author=None, name='Блины', amounts=None):
+        recipe = Recipe.objects.create(
+            author=author or self.author,
+            name=name,
+            text='Смешать и испечь.',
+            cooking_time=20,
+        )
+        recipe.tags.add(self.tag)
+        amounts = amounts or {self.salt: 5, self.flour: 200}
+        IngredientRecipe.objects.bulk_create(
+            IngredientRecipe(recipe=recipe, ingredient=ingredient,
+                             amount=amount)
+            for ingredient, amount in amounts.items()
+        )
+        return recipe
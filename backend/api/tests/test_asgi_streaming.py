@@ -0,0 +1,70 @@
+from asgiref.sync import async_to_sync
+from django.test import TransactionTestCase, override_settings
+from rest_framework.authtoken.models import Token
+
+from api.async_views import StreamingASGIHandler
+from recipes.models import (Ingredient, IngredientRecipe, ShoppingCart,
+                            ShoppingCartIngredient)
+
+from .base import NPLUSONE_SETTINGS, TEST_CACHES, APITestCase, clear_caches
+
+
+@override_settings(CACHES=TEST_CACHES, DATABASE_REPLICAS=[],
+                   **NPLUSONE_SETTINGS)
+class StreamingASGIHandlerTests(TransactionTestCase):
+    # Ответ читается в потоке пула со своим соединением с БД.
+
+    def setUp(self):
+        clear_caches()
+        self.user = APITestCase.create_user('cook')
+        self.token = Token.objects.create(user=self.user)
+        author = APITestCase.create_user('author')
+        for number in range(100):
+            ingredient = Ingredient.objects.create(
+                name=f'ингредиент {number:03}', measurement_unit='г'
+            )
+            recipe = self.create_recipe(author, number, ingredient)
+            ShoppingCart.objects.create(user=self.user, recipe=recipe)
+        ShoppingCartIngredient.objects.rebuild()
+
+    @staticmethod
+    def create_recipe(author, number, ingredient):
+        recipe = author.recipes.create(
+            name=f'Рецепт {number}', text='Смешать.', cooking_time=5
+        )
+        IngredientRecipe.objects.create(
+            recipe=recipe, ingredient=ingredient, amount=2
+        )
+        return recipe
+
+    def request(self, path):
+        self.messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b''}
+
+        async def send(message):
+            self.messages.append(message)
+
+        scope = {
+            'type': 'http',
+            'method': 'GET',
+            'path': path,
+            'query_string': b'',
+            'headers': [
+                (b'authorization', f'Token {self.token.key}'.encode()),
+                (b'host', b'testserver'),
+            ],
+        }
+        async_to_sync(StreamingASGIHandler())(scope, receive, send)
+
+    def test_shopping_cart_is_streamed_in_parts(self):
+        self.request('/api/recipes/download_shopping_cart/')
+        messages = self.messages
+        self.assertEqual(messages[0]['status'], 200)
+        bodies = [message.get('body', b'') for message in messages[1:]]
+        self.assertEqual(len(bodies), 101)
+        self.assertEqual(bodies[-1], b'')
+        lines = b''.join(bodies).decode().splitlines()
+        self.assertEqual(lines[0], '* ингредиент 000 (г) - 2')
+        self.assertEqual(len(lines), 100)
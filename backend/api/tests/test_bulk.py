@@ -0,0 +1,104 @@
+from recipes.models import Favorite, ShoppingCart, ShoppingCartIngredient
+
+from .base import APITestCase
+
+
+class BulkRecipesTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.first = self.create_recipe(name='Блины')
+        self.second = self.create_recipe(
+            name='Оладьи', amounts={self.flour: 100}
+        )
+
+    def bulk(self, method, path, recipe_ids):
+        return getattr(self.client, method)(
+            f'/api/recipes/{path}/', {'recipes': recipe_ids}, format='json'
+        )
+
+    def results(self, response):
+        self.assertEqual(response.status_code, 200)
+        return {
+            item['id']: item['result'] for item in response.data['results']
+        }
+
+    def counters(self, field):
+        self.first.refresh_from_db()
+        self.second.refresh_from_db()
+        return getattr(self.first, field), getattr(self.second, field)
+
+    def test_favorite_post_put_delete(self):
+        missing = self.second.id + 100
+        response = self.bulk(
+            'post', 'favorite', [self.first.id, missing]
+        )
+        self.assertEqual(
+            self.results(response),
+            {self.first.id: 'added', missing: 'not_found'},
+        )
+        response = self.bulk(
+            'post', 'favorite', [self.first.id, self.second.id]
+        )
+        self.assertEqual(
+            self.results(response),
+            {self.first.id: 'exists', self.second.id: 'added'},
+        )
+        self.assertEqual(self.counters('favorites_count'), (1, 1))
+
+        response = self.bulk('put', 'favorite', [self.second.id])
+        self.assertEqual(
+            self.results(response),
+            {self.second.id: 'exists', self.first.id: 'removed'},
+        )
+        self.assertEqual(self.counters('favorites_count'), (0, 1))
+
+        response = self.bulk(
+            'delete', 'favorite', [self.first.id, self.second.id]
+        )
+        self.assertEqual(
+            self.results(response),
+            {self.first.id: 'not_found', self.second.id: 'removed'},
+        )
+        self.assertEqual(self.counters('favorites_count'), (0, 0))
+        self.assertFalse(Favorite.objects.exists())
+
+    def test_shopping_cart_bulk_keeps_totals(self):
+        self.bulk('post', 'shopping_cart', [self.first.id, self.second.id])
+        self.assertEqual(self.counters('in_carts_count'), (1, 1))
+        self.assertEqual(
+            dict(ShoppingCartIngredient.objects.filter(
+                user=self.user
+            ).values_list('ingredient_id', 'amount')),
+            {self.salt.id: 5, self.flour.id: 300},
+        )
+
+        self.bulk('put', 'shopping_cart', [self.second.id])
+        self.assertEqual(self.counters('in_carts_count'), (0, 1))
+        self.assertEqual(
+            dict(ShoppingCartIngredient.objects.filter(
+                user=self.user
+            ).values_list('ingredient_id', 'amount')),
+            {self.flour.id: 100},
+        )
+
+        self.bulk('delete', 'shopping_cart', [self.second.id])
+        self.assertEqual(self.counters('in_carts_count'), (0, 0))
+        self.assertFalse(ShoppingCart.objects.exists())
+        self.assertEqual(ShoppingCartIngredient.objects.inconsistencies(), {})
+
+    def test_invalid_body_is_rejected(self):
+        response = self.client.post(
+            '/api/recipes/favorite/', {'recipes': 'abc'}, format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Favorite.objects.exists())
+
+    def test_single_favorite_toggle(self):
+        url = f'/api/recipes/{self.first.id}/favorite/'
+        self.assertEqual(self.client.post(url).status_code, 201)
+        self.assertEqual(self.client.post(url).status_code, 400)
+        self.assertEqual(self.counters('favorites_count'), (1, 0))
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertEqual(self.client.delete(url).status_code, 400)
+        self.assertEqual(self.counters('favorites_count'), (0, 0))
@@ -0,0 +1,24 @@
+from .base import APITestCase
+
+
+class CookableTests(APITestCase):
+
+    def test_recipes_ordered_by_missing_ingredients(self):
+        full = self.create_recipe(name='Соль', amounts={self.salt: 5})
+        partial = self.create_recipe(name='Блины')
+        response = self.client.get(
+            '/api/recipes/cookable/', {'ingredients': str(self.salt.id)}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results']],
+            [full.id, partial.id],
+        )
+
+    def test_invalid_ingredient_ids_are_rejected(self):
+        for value in ('', 'abc', '²', '1,-2'):
+            with self.subTest(value=value):
+                response = self.client.get(
+                    '/api/recipes/cookable/', {'ingredients': value}
+                )
+                self.assertEqual(response.status_code, 400)
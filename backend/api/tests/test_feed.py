@@ -0,0 +1,64 @@
+from django.test import override_settings
+
+from recipes.models import FeedEntry
+from users.models import Follow
+
+from .base import APITestCase
+
+
+class FeedTests(APITestCase):
+
+    def feed_ids(self):
+        response = self.client.get('/api/recipes/feed/')
+        self.assertEqual(response.status_code, 200)
+        return [recipe['id'] for recipe in response.data['results']]
+
+    def publish(self, author=None, name='Блины'):
+        recipe = self.create_recipe(author=author, name=name)
+        with self.captureOnCommitCallbacks(execute=True):
+            FeedEntry.objects.fan_out(recipe)
+        return recipe
+
+    def test_subscribe_fills_feed_and_new_recipes_fan_out(self):
+        old = self.create_recipe(name='Старый')
+        response = self.client.post(f'/api/users/{self.author.id}/subscribe/')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.feed_ids(), [old.id])
+
+        new = self.publish(name='Новый')
+        self.assertEqual(self.feed_ids(), [new.id, old.id])
+
+        response = self.client.delete(
+            f'/api/users/{self.author.id}/subscribe/'
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.feed_ids(), [])
+
+    @override_settings(FEED_LENGTH=2)
+    def test_fan_out_trims_feed_after_commit(self):
+        Follow.objects.create(user=self.user, author=self.author)
+        recipes = [
+            self.publish(name=f'Рецепт {number}') for number in range(3)
+        ]
+        self.assertEqual(
+            set(FeedEntry.objects.filter(
+                user=self.user
+            ).values_list('recipe_id', flat=True)),
+            {recipes[1].id, recipes[2].id},
+        )
+
+    @override_settings(FEED_FANOUT_LIMIT=2)
+    def test_popular_author_recipes_are_merged_on_read(self):
+        popular = self.create_user('popular')
+        Follow.objects.bulk_create([
+            Follow(user=self.user, author=self.author),
+            Follow(user=self.user, author=popular),
+            Follow(user=self.create_user('fan'), author=popular),
+        ])
+        first = self.publish(name='Первый')
+        second = self.publish(author=popular, name='Второй')
+        third = self.publish(name='Третий')
+        self.assertFalse(
+            FeedEntry.objects.filter(recipe=second).exists()
+        )
+        self.assertEqual(self.feed_ids(), [third.id, second.id, first.id])
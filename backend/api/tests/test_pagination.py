@@ -0,0 +1,61 @@
+import base64
+import json
+
+from users.models import Follow
+
+from .base import APITestCase
+
+
+def encode_cursor(position, reverse=0):
+    return base64.urlsafe_b64encode(
+        json.dumps({'p': position, 'r': reverse}).encode()
+    ).decode()
+
+
+class CursorPaginationTests(APITestCase):
+
+    def test_pages_follow_each_other_without_gaps(self):
+        recipe_ids = [
+            self.create_recipe(name=f'Рецепт {number}').id
+            for number in range(7)
+        ]
+        seen = []
+        url = '/api/recipes/?cursor=&limit=3'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            seen += [recipe['id'] for recipe in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(seen, sorted(recipe_ids, reverse=True))
+
+    def test_previous_link_returns_previous_page(self):
+        for number in range(5):
+            self.create_recipe(name=f'Рецепт {number}')
+        first = self.client.get('/api/recipes/?cursor=&limit=2')
+        second = self.client.get(first.data['next'])
+        previous = self.client.get(second.data['previous'])
+        self.assertEqual(previous.data['results'], first.data['results'])
+
+    def test_tampered_cursors_are_rejected(self):
+        Follow.objects.create(user=self.user, author=self.author)
+        self.create_recipe()
+        cursors = [
+            'not-base64!',
+            encode_cursor([{'a': 1}, 1]),
+            encode_cursor(['x', 'y']),
+            encode_cursor([1]),
+            base64.urlsafe_b64encode(b'[1, 2]').decode(),
+        ]
+        recipe_cursors = cursors + [
+            encode_cursor(['garbage', 1]),
+            encode_cursor(['2024-01-01T00:00:00+00:00', 10 ** 30]),
+        ]
+        for path, path_cursors in (
+            ('/api/recipes/', recipe_cursors),
+            ('/api/recipes/feed/', recipe_cursors),
+            ('/api/users/subscriptions/', cursors),
+        ):
+            for cursor in path_cursors:
+                with self.subTest(path=path, cursor=cursor):
+                    response = self.client.get(path, {'cursor': cursor})
+                    self.assertEqual(response.status_code, 404)
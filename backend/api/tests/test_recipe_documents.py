@@ -0,0 +1,84 @@
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from api.caching import get_recipe_documents
+from api.serializers import RecipeSerializer, build_recipe_documents
+from recipes.models import IngredientRecipe, Recipe
+
+from .base import APITestCase
+
+
+class RecipeDocumentCacheTests(APITestCase):
+
+    def get_recipe(self, recipe):
+        response = self.client.get(f'/api/recipes/{recipe.id}/')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_ingredient_change_invalidates_document(self):
+        recipe = self.create_recipe()
+        self.get_recipe(recipe)
+        IngredientRecipe.objects.filter(
+            recipe=recipe, ingredient=self.salt
+        ).get().delete()
+        self.assertEqual(
+            [row['id'] for row in self.get_recipe(recipe)['ingredients']],
+            [self.flour.id],
+        )
+
+    def test_author_change_invalidates_document(self):
+        recipe = self.create_recipe()
+        self.get_recipe(recipe)
+        self.author.first_name = 'Анна'
+        self.author.save()
+        self.assertEqual(
+            self.get_recipe(recipe)['author']['first_name'], 'Анна'
+        )
+
+    def test_update_response_uses_new_document(self):
+        recipe = self.create_recipe(author=self.user)
+        self.get_recipe(recipe)
+        response = self.client.patch(
+            f'/api/recipes/{recipe.id}/',
+            {'ingredients': [{'id': self.flour.id, 'amount': 50}]},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(row['id'], row['amount'])
+             for row in response.data['ingredients']],
+            [(self.flour.id, 50)],
+        )
+
+    def test_document_built_before_invalidation_is_not_served(self):
+        recipe = self.create_recipe()
+
+        def build_then_invalidate(recipe_ids):
+            try:
+                return build_recipe_documents(recipe_ids)
+            finally:
+                IngredientRecipe.objects.filter(recipe=recipe).delete()
+
+        stale = get_recipe_documents([recipe], build_then_invalidate)
+        self.assertEqual(len(stale[recipe.id]['ingredients']), 2)
+        fresh = get_recipe_documents(
+            [Recipe.objects.get(id=recipe.id)], build_recipe_documents
+        )
+        self.assertEqual(fresh[recipe.id]['ingredients'], [])
+
+    def test_list_keeps_recipes_without_documents(self):
+        recipes = [
+            self.create_recipe(name=f'Рецепт {number}')
+            for number in range(3)
+        ]
+        page = list(Recipe.objects.for_viewer(self.user).order_by('id'))
+        Recipe.objects.filter(id=recipes[1].id).delete()
+        request = Request(APIRequestFactory().get('/api/recipes/'))
+        request.user = self.user
+        data = RecipeSerializer(
+            page, many=True, context={'request': request}
+        ).data
+        self.assertEqual(
+            [recipe['id'] for recipe in data],
+            [recipe.id for recipe in recipes],
+        )
@@ -0,0 +1,222 @@
+import base64
+import glob
+import os
+import shutil
+import tempfile
+from io import BytesIO
+from unittest import mock
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TransactionTestCase, override_settings
+from PIL import Image
+from rest_framework.test import APIClient
+
+from recipes.images import IMAGE_DIR, process_recipe_image
+from recipes.models import Ingredient, Recipe, Tag
+
+from .base import NPLUSONE_SETTINGS, TEST_CACHES, APITestCase, clear_caches
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def image_data(color, image_format='PNG'):
+    buffer = BytesIO()
+    Image.new('RGB', (40, 30), color).save(buffer, image_format)
+    encoded = base64.b64encode(buffer.getvalue()).decode()
+    return f'data:image/{image_format.lower()};base64,{encoded}'
+
+
+@override_settings(CACHES=TEST_CACHES, DATABASE_REPLICAS=[],
+                   MEDIA_ROOT=MEDIA_ROOT, RECIPE_IMAGE_ASYNC=False,
+                   **NPLUSONE_SETTINGS)
+class RecipeImageTests(TransactionTestCase):
+    # Обработка изображения запускается после фиксации транзакции.
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        clear_caches()
+        self.user = APITestCase.create_user('cook')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.tag = Tag.objects.create(
+            name='Завтрак', color='#E26C2D', slug='breakfast'
+        )
+        self.salt = Ingredient.objects.create(
+            name='соль', measurement_unit='г'
+        )
+
+    def payload(self, image):
+        return {
+            'ingredients': [{'id': self.salt.id, 'amount': 5}],
+            'tags': [self.tag.id],
+            'image': image,
+            'name': 'Омлет',
+            'text': 'Взбить и пожарить.',
+            'cooking_time': 10,
+        }
+
+    def stored_files(self, recipe):
+        paths = [recipe.image.name] + [
+            path
+            for size_name, paths in recipe.image_renditions.items()
+            if size_name != 'token'
+            for path in paths.values()
+        ]
+        return [os.path.join(MEDIA_ROOT, path) for path in paths]
+
+    def test_invalid_images_are_rejected(self):
+        not_image = base64.b64encode(b'not an image').decode()
+        for image in ('data:image/png;base64,AAAA!!!',
+                      f'data:image/png;base64,{not_image}'):
+            with self.subTest(image=image):
+                response = self.client.post(
+                    '/api/recipes/', self.payload(image), format='json'
+                )
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('image', response.data)
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_decompression_bomb_is_rejected(self):
+        with mock.patch.object(Image, 'MAX_IMAGE_PIXELS', 100):
+            response = self.client.post(
+                '/api/recipes/', self.payload(image_data('red')),
+                format='json',
+            )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('image', response.data)
+
+    def test_create_without_image(self):
+        response = self.client.post(
+            '/api/recipes/', self.payload(''), format='json'
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertIsNone(response.data['image'])
+
+    def test_create_returns_processed_image(self):
+        response = self.client.post(
+            '/api/recipes/', self.payload(image_data('red')), format='json'
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertIsNotNone(response.data['image'])
+        self.assertEqual(
+            set(response.data['image_renditions']),
+            {'small', 'medium', 'large'},
+        )
+
+    def test_replacing_image_deletes_old_files(self):
+        response = self.client.post(
+            '/api/recipes/', self.payload(image_data('red')), format='json'
+        )
+        recipe = Recipe.objects.get(id=response.data['id'])
+        old_files = self.stored_files(recipe)
+        self.assertTrue(all(map(os.path.exists, old_files)))
+
+        response = self.client.patch(
+            f'/api/recipes/{recipe.id}/',
+            {'image': image_data('blue', 'JPEG')}, format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        recipe.refresh_from_db()
+        self.assertNotIn('pending', recipe.image_renditions)
+        self.assertTrue(all(map(os.path.exists, self.stored_files(recipe))))
+        self.assertFalse(any(map(os.path.exists, old_files)))
+
+    def test_unchanged_image_is_not_processed_again(self):
+        image = image_data('red')
+        response = self.client.post(
+            '/api/recipes/', self.payload(image), format='json'
+        )
+        recipe = Recipe.objects.get(id=response.data['id'])
+        stored = sorted(os.listdir(os.path.join(MEDIA_ROOT, IMAGE_DIR)))
+
+        with mock.patch('recipes.images.process_recipe_image') as process:
+            response = self.client.patch(
+                f'/api/recipes/{recipe.id}/', {'image': image}, format='json'
+            )
+        self.assertEqual(response.status_code, 200)
+        process.assert_not_called()
+        self.assertEqual(
+            sorted(os.listdir(os.path.join(MEDIA_ROOT, IMAGE_DIR))), stored
+        )
+        self.assertEqual(
+            Recipe.objects.get(id=recipe.id).image_renditions,
+            recipe.image_renditions,
+        )
+
+    def multipart_payload(self, upload):
+        return {
+            'ingredients[0]id': self.salt.id,
+            'ingredients[0]amount': 5,
+            'tags': [self.tag.id],
+            'image': upload,
+            'name': 'Омлет',
+            'text': 'Взбить и пожарить.',
+            'cooking_time': 10,
+        }
+
+    def upload(self, color='red'):
+        content = base64.b64decode(image_data(color).split(',')[1])
+        return SimpleUploadedFile('omelette.png', content, 'image/png')
+
+    def test_multipart_upload(self):
+        response = self.client.post(
+            '/api/recipes/', self.multipart_payload(self.upload()),
+            format='multipart',
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            set(response.data['image_renditions']),
+            {'small', 'medium', 'large'},
+        )
+        recipe = Recipe.objects.get(id=response.data['id'])
+        self.assertEqual(
+            list(recipe.ingridients_recipe.values_list(
+                'ingredient_id', 'amount'
+            )),
+            [(self.salt.id, 5)],
+        )
+        self.assertTrue(all(map(os.path.exists, self.stored_files(recipe))))
+
+    def test_multipart_upload_over_limit_is_rejected(self):
+        with self.settings(RECIPE_IMAGE_MAX_SIZE=16):
+            response = self.client.post(
+                '/api/recipes/', self.multipart_payload(self.upload()),
+                format='multipart',
+            )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('image', response.data)
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_multipart_upload_of_non_image_is_rejected(self):
+        upload = SimpleUploadedFile('omelette.png', b'not an image')
+        response = self.client.post(
+            '/api/recipes/', self.multipart_payload(upload),
+            format='multipart',
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('image', response.data)
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_stale_job_deletes_its_files(self):
+        response = self.client.post(
+            '/api/recipes/', self.payload(image_data('red')), format='json'
+        )
+        recipe = Recipe.objects.get(id=response.data['id'])
+        content = base64.b64decode(image_data('green').split(',')[1])
+        original = default_storage.save(
+            f'{IMAGE_DIR}stale.png', ContentFile(content)
+        )
+        process_recipe_image(recipe.id, 'stale', original)
+        self.assertEqual(
+            glob.glob(os.path.join(MEDIA_ROOT, IMAGE_DIR, 'stale*')), []
+        )
+        self.assertEqual(
+            Recipe.objects.get(id=recipe.id).image_renditions,
+            recipe.image_renditions,
+        )
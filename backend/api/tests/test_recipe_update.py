@@ -0,0 +1,121 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from recipes.models import (Ingredient, IngredientRecipe, Recipe, ShoppingCart,
+                            ShoppingCartIngredient)
+
+from .base import APITestCase
+
+
+class RecipeUpdateTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.sugar = Ingredient.objects.create(
+            name='сахар', measurement_unit='г'
+        )
+
+    def setUp(self):
+        super().setUp()
+        self.recipe = self.create_recipe(author=self.user)
+        self.url = f'/api/recipes/{self.recipe.id}/'
+
+    def patch(self, data):
+        response = self.client.patch(self.url, data, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def rows(self):
+        return {
+            row.ingredient_id: (row.id, row.amount)
+            for row in IngredientRecipe.objects.filter(recipe=self.recipe)
+        }
+
+    def test_ingredients_are_updated_by_diff(self):
+        before = self.rows()
+        response = self.patch({'ingredients': [
+            {'id': self.salt.id, 'amount': 5},
+            {'id': self.flour.id, 'amount': 250},
+            {'id': self.sugar.id, 'amount': 30},
+        ]})
+        after = self.rows()
+        self.assertEqual(after[self.salt.id], before[self.salt.id])
+        self.assertEqual(
+            after[self.flour.id], (before[self.flour.id][0], 250)
+        )
+        self.assertEqual(after[self.sugar.id][1], 30)
+        self.assertEqual(
+            {row['id']: row['amount']
+             for row in response.data['ingredients']},
+            {self.salt.id: 5, self.flour.id: 250, self.sugar.id: 30},
+        )
+
+        self.patch({'ingredients': [{'id': self.flour.id, 'amount': 250}]})
+        self.assertEqual(
+            self.rows(), {self.flour.id: (before[self.flour.id][0], 250)}
+        )
+
+    def test_patch_touches_only_supplied_fields(self):
+        before = self.rows()
+        response = self.patch({'name': 'Тонкие блины'})
+        self.assertEqual(response.data['name'], 'Тонкие блины')
+        self.assertEqual(self.rows(), before)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.text, 'Смешать и испечь.')
+        self.assertEqual(self.recipe.cooking_time, 20)
+        self.assertEqual(
+            list(self.recipe.tags.values_list('id', flat=True)),
+            [self.tag.id],
+        )
+
+    def test_unchanged_ingredients_and_tags_are_not_rewritten(self):
+        before = self.rows()
+        with CaptureQueriesContext(connection) as context:
+            self.patch({
+                'ingredients': [
+                    {'id': self.flour.id, 'amount': 200},
+                    {'id': self.salt.id, 'amount': 5},
+                ],
+                'tags': [self.tag.id],
+            })
+        tables = {
+            IngredientRecipe._meta.db_table, Recipe.tags.through._meta.db_table
+        }
+        self.assertEqual(
+            [
+                query['sql'] for query in context.captured_queries
+                if not query['sql'].startswith('SELECT')
+                and any(table in query['sql'] for table in tables)
+            ],
+            [],
+        )
+        self.assertEqual(self.rows(), before)
+
+    def test_ingredient_changes_keep_cart_totals(self):
+        ShoppingCart.objects.create(user=self.author, recipe=self.recipe)
+        ShoppingCartIngredient.objects.rebuild()
+        self.patch({'ingredients': [
+            {'id': self.flour.id, 'amount': 100},
+            {'id': self.sugar.id, 'amount': 30},
+        ]})
+        self.assertEqual(
+            dict(ShoppingCartIngredient.objects.filter(
+                user=self.author
+            ).values_list('ingredient_id', 'amount')),
+            {self.flour.id: 100, self.sugar.id: 30},
+        )
+        self.assertEqual(ShoppingCartIngredient.objects.inconsistencies(), {})
+
+    def test_invalid_patch_changes_nothing(self):
+        before = self.rows()
+        response = self.client.patch(
+            self.url,
+            {'name': 'Оладьи', 'ingredients': [
+                {'id': self.salt.id, 'amount': 0},
+            ]},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.rows(), before)
+        self.assertEqual(Recipe.objects.get(id=self.recipe.id).name, 'Блины')
@@ -0,0 +1,55 @@
+import io
+import os
+import tempfile
+
+from django.core.management import call_command
+from django.test import override_settings
+
+from recipes.models import Ingredient
+
+from .base import APITestCase
+
+
+class ReferenceCacheTests(APITestCase):
+
+    def search(self, name):
+        response = self.client.get('/api/ingredients/', {'name': name})
+        self.assertEqual(response.status_code, 200)
+        return [ingredient['name'] for ingredient in response.json()]
+
+    def test_ingredient_search_sees_loaded_ingredients(self):
+        self.assertEqual(self.search('со'), ['соль'])
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'ingredients.csv')
+            with open(path, 'w', encoding='utf-8') as file:
+                file.write('сода,г\n')
+            call_command('load_ingredients', path, stdout=io.StringIO())
+        self.assertEqual(self.search('со'), ['сода', 'соль'])
+
+    @override_settings(INGREDIENT_SEARCH_LIMIT=3)
+    def test_ingredient_search_is_capped(self):
+        Ingredient.objects.bulk_create(
+            Ingredient(name=name, measurement_unit='г')
+            for name in ['сахар', 'сахарная пудра', 'тростниковый сахар',
+                         'ванильный сахар']
+        )
+        self.assertEqual(
+            self.search('сахар'),
+            ['сахар', 'сахарная пудра', 'ванильный сахар'],
+        )
+        with self.settings(INGREDIENT_SEARCH_LIMIT=1):
+            self.assertEqual(self.search('саха'), ['сахар'])
+
+    def test_tag_changes_invalidate_cached_responses(self):
+        response = self.client.get('/api/tags/')
+        self.assertEqual(response.json()[0]['name'], 'Завтрак')
+        etag = response['ETag']
+        self.assertEqual(
+            self.client.get('/api/tags/', HTTP_IF_NONE_MATCH=etag).status_code,
+            304,
+        )
+        self.tag.name = 'Бранч'
+        self.tag.save()
+        response = self.client.get('/api/tags/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()[0]['name'], 'Бранч')
@@ -0,0 +1,33 @@
+from unittest import mock
+
+from django.test import override_settings
+
+from backend.db_router import PIN_COOKIE, is_pinned_to_primary
+
+from .base import APITestCase
+
+
+@override_settings(DATABASE_REPLICAS=['default'], REPLICA_PIN_SECONDS=10)
+class ReplicaPinTests(APITestCase):
+
+    def test_write_pins_author_of_write_to_primary(self):
+        recipe = self.create_recipe()
+        response = self.client.post(f'/api/recipes/{recipe.id}/favorite/')
+        self.assertEqual(response.status_code, 201)
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+        request = self.client.get('/api/recipes/').wsgi_request
+        self.assertTrue(is_pinned_to_primary(request, self.user.id))
+        self.assertFalse(is_pinned_to_primary(request, self.author.id))
+
+    def test_pin_expires(self):
+        recipe = self.create_recipe()
+        self.client.post(f'/api/recipes/{recipe.id}/favorite/')
+        request = self.client.get('/api/recipes/').wsgi_request
+        with mock.patch('time.time', return_value=10 ** 10):
+            self.assertFalse(is_pinned_to_primary(request, self.user.id))
+
+    def test_forged_pin_is_ignored(self):
+        self.client.cookies[PIN_COOKIE] = str(self.user.id)
+        request = self.client.get('/api/recipes/').wsgi_request
+        self.assertFalse(is_pinned_to_primary(request, self.user.id))
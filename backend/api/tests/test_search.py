@@ -0,0 +1,75 @@
+from recipes.models import Ingredient, Tag
+from recipes.search import update_search_index
+
+from .base import APITestCase
+
+
+class RecipeSearchTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.dinner = Tag.objects.create(
+            name='Ужин', color='#49B64E', slug='dinner'
+        )
+        cls.cheese = Ingredient.objects.create(
+            name='творог', measurement_unit='г'
+        )
+
+    def setUp(self):
+        super().setUp()
+        # Порядок создания обратен релевантности: новые рецепты идут
+        # первыми только без поиска.
+        self.in_name = self.create_recipe(name='Сырники с творогом')
+        self.in_ingredients = self.create_recipe(
+            name='Запеканка', amounts={self.cheese: 300}
+        )
+        self.in_text = self.create_recipe(name='Оладьи')
+        self.in_text.text = 'Можно добавить творог.'
+        self.in_text.save()
+        self.other = self.create_recipe(author=self.user, name='Омлет')
+        self.in_ingredients.tags.add(self.dinner)
+        self.other.tags.set([self.dinner])
+        update_search_index()
+
+    def recipe_ids(self, **params):
+        response = self.client.get('/api/recipes/', params)
+        self.assertEqual(response.status_code, 200)
+        return [recipe['id'] for recipe in response.data['results']]
+
+    def test_search_ranks_name_over_text_over_ingredients(self):
+        self.assertEqual(
+            self.recipe_ids(search='творог'),
+            [self.in_name.id, self.in_text.id, self.in_ingredients.id],
+        )
+
+    def test_search_sees_updated_recipe(self):
+        response = self.client.patch(
+            f'/api/recipes/{self.other.id}/', {'text': 'С творогом.'},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(self.other.id, self.recipe_ids(search='творог'))
+
+    def test_blank_search_returns_all_recipes(self):
+        self.assertEqual(len(self.recipe_ids(search='  ')), 4)
+
+    def test_tags_mode_any_and_all(self):
+        tags = [self.tag.slug, self.dinner.slug]
+        self.assertEqual(
+            self.recipe_ids(tags=tags),
+            [self.other.id, self.in_text.id, self.in_ingredients.id,
+             self.in_name.id],
+        )
+        self.assertEqual(
+            self.recipe_ids(tags=tags, tags_mode='any'),
+            self.recipe_ids(tags=tags),
+        )
+        self.assertEqual(
+            self.recipe_ids(tags=tags, tags_mode='all'),
+            [self.in_ingredients.id],
+        )
+        self.assertEqual(
+            self.recipe_ids(tags=[self.dinner.slug], search='творог'),
+            [self.in_ingredients.id],
+        )
@@ -0,0 +1,46 @@
+from recipes.models import ShoppingCart, ShoppingCartIngredient
+
+from .base import APITestCase
+
+
+class ShoppingCartTotalsTests(APITestCase):
+
+    def cart_totals(self):
+        return dict(ShoppingCartIngredient.objects.filter(
+            user=self.user
+        ).values_list('ingredient_id', 'amount'))
+
+    def test_add_and_remove_recipe_keep_totals(self):
+        recipe = self.create_recipe()
+        url = f'/api/recipes/{recipe.id}/shopping_cart/'
+
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            self.cart_totals(), {self.salt.id: 5, self.flour.id: 200}
+        )
+        self.assertEqual(ShoppingCartIngredient.objects.inconsistencies(), {})
+
+        response = self.client.delete(url)
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.cart_totals(), {})
+        self.assertEqual(ShoppingCartIngredient.objects.inconsistencies(), {})
+        self.assertFalse(ShoppingCart.objects.exists())
+
+    def test_single_add_after_bulk_add_keeps_counters(self):
+        recipe = self.create_recipe()
+        response = self.client.post(
+            '/api/recipes/shopping_cart/', {'recipes': [recipe.id]},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        response = self.client.post(
+            f'/api/recipes/{recipe.id}/shopping_cart/'
+        )
+        self.assertEqual(response.status_code, 400)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.in_carts_count, 1)
+        self.assertEqual(
+            self.cart_totals(), {self.salt.id: 5, self.flour.id: 200}
+        )
+        self.assertEqual(ShoppingCartIngredient.objects.inconsistencies(), {})
@@ -0,0 +1,43 @@
+from users.models import Follow
+
+from .base import APITestCase
+
+
+class SubscriptionsTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        Follow.objects.create(user=self.user, author=self.author)
+        self.recipes = [
+            self.create_recipe(name=f'Рецепт {number}')
+            for number in range(3)
+        ]
+
+    def get_subscription(self, recipes_limit):
+        response = self.client.get(
+            '/api/users/subscriptions/', {'recipes_limit': recipes_limit}
+        )
+        self.assertEqual(response.status_code, 200)
+        [subscription] = response.data['results']
+        return subscription
+
+    def test_recipes_limit_limits_recipes(self):
+        subscription = self.get_subscription('2')
+        self.assertEqual(subscription['recipes_count'], 3)
+        self.assertEqual(
+            [recipe['id'] for recipe in subscription['recipes']],
+            [self.recipes[2].id, self.recipes[1].id],
+        )
+
+    def test_invalid_recipes_limit_is_ignored(self):
+        for value in ('abc', '²', '-1'):
+            with self.subTest(value=value):
+                subscription = self.get_subscription(value)
+                self.assertEqual(len(subscription['recipes']), 3)
+
+    def test_repeated_subscribe_is_rejected(self):
+        response = self.client.post(
+            f'/api/users/{self.author.id}/subscribe/'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Follow.objects.count(), 1)
@@ -0,0 +1,178 @@
+"""Замеры обработки запросов: SQL, сериализация, рендеринг.
+
+TimingMiddleware заводит замеры запроса и отдаёт их в заголовке
+Server-Timing и в гистограммы /api/metrics/. Замеры хранятся в
+контекстной переменной, поэтому их видит и поток пула, в котором под
+ASGI выполняется представление. Выбранные для выборки запросы
+профилируются, и профили медленных из них сохраняются в PROFILE_DIR.
+Повторы SQL-запросов одной формы ищет api.nplusone.
+"""
+import cProfile
+import logging
+import os
+import random
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.utils.deprecation import MiddlewareMixin
+
+from .metrics import registry
+from .nplusone import QueryFingerprints
+
+logger = logging.getLogger(__name__)
+
+current_timings = ContextVar('current_timings', default=None)
+
+
+class RequestTimings:
+    """Замеры одного запроса, длительности в секундах."""
+
+    def __init__(self, sampled=False, detect_nplusone=False):
+        self.started = time.perf_counter()
+        self.durations = defaultdict(float)
+        self.queries = 0
+        self.active = set()
+        self.sampled = sampled
+        self.profile = None
+        self.fingerprints = QueryFingerprints() if detect_nplusone else None
+
+    def add(self, name, duration):
+        self.durations[name] += duration
+
+
+@contextmanager
+def timed(name):
+    """Добавляет время блока к замеру name текущего запроса.
+
+    Вложенные блоки с тем же именем второй раз не учитываются.
+    """
+    timings = current_timings.get()
+    if timings is None or name in timings.active:
+        yield
+        return
+    timings.active.add(name)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.active.discard(name)
+        timings.add(name, time.perf_counter() - started)
+
+
+def record_query(execute, sql, params, many, context):
+    """Обёртка выполнения SQL, считающая запросы и их время."""
+    timings = current_timings.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.queries += 1
+        timings.add('db', time.perf_counter() - started)
+        if timings.fingerprints is not None:
+            timings.fingerprints.record(sql)
+
+
+class TimedSerializerMixin:
+    """Учитывает время to_representation в замере serialize."""
+
+    def to_representation(self, instance):
+        with timed('serialize'):
+            return super().to_representation(instance)
+
+
+class ProfiledViewMixin:
+    """Профилирует выбранный для выборки запрос в потоке представления."""
+
+    def dispatch(self, request, *args, **kwargs):
+        timings = current_timings.get()
+        if timings is None or not timings.sampled:
+            return super().dispatch(request, *args, **kwargs)
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Профилировщик уже работает в другом потоке процесса.
+            return super().dispatch(request, *args, **kwargs)
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            profile.disable()
+            timings.profile = profile
+
+
+def server_timing(timings, total):
+    parts = []
+    for name in ('db', 'serialize', 'render'):
+        if name in timings.durations:
+            part = f'{name};dur={timings.durations[name] * 1000:.1f}'
+            if name == 'db':
+                part += f';desc="{timings.queries} queries"'
+            parts.append(part)
+    parts.append(f'total;dur={total * 1000:.1f}')
+    return ', '.join(parts)
+
+
+def save_profile(profile, route, total):
+    path = os.path.join(settings.PROFILE_DIR, '{}-{}-{}ms.prof'.format(
+        int(time.time() * 1000), route.replace(':', '-'), int(total * 1000)
+    ))
+    try:
+        os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+        profile.dump_stats(path)
+    except OSError:
+        logger.warning('Не удалось сохранить профиль в %s.', path,
+                       exc_info=True)
+
+
+class TimingMiddleware(MiddlewareMixin):
+    """Замеры запроса: Server-Timing, гистограммы и профили медленных
+    запросов. Стоит первой в MIDDLEWARE, чтобы учесть всю обработку."""
+
+    def process_request(self, request):
+        request.timings = RequestTimings(
+            sampled=random.random() < settings.PROFILE_SAMPLE_RATE,
+            detect_nplusone=settings.NPLUSONE_DETECTION,
+        )
+        current_timings.set(request.timings)
+
+    def process_template_response(self, request, response):
+        timings = getattr(request, 'timings', None)
+        if timings is not None and not response.is_rendered:
+            started = time.perf_counter()
+            response.add_post_render_callback(
+                lambda response: timings.add(
+                    'render', time.perf_counter() - started
+                )
+            )
+        return response
+
+    def process_response(self, request, response):
+        timings = getattr(request, 'timings', None)
+        if timings is None:
+            return response
+        current_timings.set(None)
+        total = time.perf_counter() - timings.started
+        response['Server-Timing'] = server_timing(timings, total)
+        match = request.resolver_match
+        route = match.view_name if match else 'unmatched'
+        values = {
+            'request_duration_seconds': total,
+            'db_queries': timings.queries,
+            'db_duration_seconds': timings.durations['db'],
+        }
+        for name in ('serialize', 'render'):
+            if name in timings.durations:
+                values[f'{name}_duration_seconds'] = timings.durations[name]
+        registry.observe_request(route, request.method, values)
+        if timings.profile is not None and (
+            total * 1000 >= settings.PROFILE_SLOW_MS
+        ):
+            save_profile(timings.profile, route, total)
+        if timings.fingerprints is not None:
+            timings.fingerprints.report(route)
+        return response
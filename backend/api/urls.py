@@ -1,6 +1,9 @@
+from django.conf import settings
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
+from .async_views import async_read_urls
+from .metrics import metrics_view
 from .views import IngredientViewSet, RecipeViewSet, TagViewSet, UsersViewSet
 
 app_name = 'api'
@@ -12,8 +15,13 @@ router_v1.register('ingredients', IngredientViewSet)
 router_v1.register('tags', TagViewSet)
 router_v1.register('recipes', RecipeViewSet)
 
+router_urls = router_v1.urls
+if settings.ASYNC_READ_VIEWS:
+    router_urls = async_read_urls(router_urls)
+
 urlpatterns = [
-    path('', include(router_v1.urls)),
+    path('metrics/', metrics_view, name='metrics'),
+    path('', include(router_urls)),
     path('', include('djoser.urls')),
     path('auth/', include('djoser.urls.authtoken'))
 ]
@@ -1,43 +1,147 @@
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import connections, router
+from django.db.models import Count, F
+from django.db.transaction import atomic
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import JSONParser, MultiPartParser
 from rest_framework.permissions import (SAFE_METHODS, IsAuthenticated,
                                         IsAuthenticatedOrReadOnly)
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 
-from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
+from backend.db_router import (is_pinned_to_primary, pin_to_primary,
+                               replica_reads)
+from recipes.images import LimitedTemporaryFileUploadHandler
+from recipes.ingredient_index import ingredient_index
+from recipes.models import (Favorite, FeedEntry, Ingredient, Recipe,
+                            ShoppingCart, ShoppingCartIngredient, Tag)
 from users.models import Follow, User
 
+from .caching import CachedReferenceMixin, batch_invalidations
 from .filters import IngredientsSearchFilter, RecipeFilter
 from .pagination import CustomPagination
 from .permissions import IsAdminOrReadOnly
 from .report_utils import download_shopping_cart
-from .serializers import (CreateRecipeSerializer, FollowSerializer,
+from .serializers import (BulkRecipesSerializer, CookableRecipeSerializer,
+                          CreateRecipeSerializer, FollowSerializer,
                           IngredientSerializer, RecipeSerializer,
                           ShortRecipeSerializer, TagSerializer,
-                          UsersSerializer)
+                          UsersSerializer, get_recipes_limit)
+from .timing import ProfiledViewMixin
+
+# Денормализованные счётчики рецепта для моделей избранного и покупок.
+RECIPE_COUNTERS = {
+    Favorite: 'favorites_count',
+    ShoppingCart: 'in_carts_count',
+}
+COOKABLE_MAX_INGREDIENTS = 100
+
+
+def lock_user(user):
+    """Блокирует строку пользователя до конца транзакции.
+
+    Все изменения избранного и списка покупок пользователя берут эту
+    блокировку и выполняются по очереди, иначе счётчики рецептов и суммы
+    списка покупок могли бы разойтись.
+    """
+    list(User.objects.select_for_update().filter(
+        pk=user.pk
+    ).values_list('pk', flat=True))
+
+
+def create_ignoring_conflicts(model, **values):
+    """Вставляет строку одним запросом без проверки существования.
+
+    При нарушении уникальности вставка пропускается (ON CONFLICT DO NOTHING
+    или его аналог в СУБД). Возвращает False, если такая строка уже есть.
+    """
+    obj = model(**values)
+    fields = [
+        field for field in model._meta.concrete_fields
+        if not field.primary_key
+    ]
+    connection = connections[router.db_for_write(model)]
+    ops = connection.ops
+    sql = '{} {} ({}) VALUES ({}) {}'.format(
+        ops.insert_statement(ignore_conflicts=True),
+        ops.quote_name(model._meta.db_table),
+        ', '.join(ops.quote_name(field.column) for field in fields),
+        ', '.join(['%s'] * len(fields)),
+        ops.ignore_conflicts_suffix_sql(ignore_conflicts=True),
+    )
+    params = [
+        field.get_db_prep_save(field.pre_save(obj, True), connection)
+        for field in fields
+    ]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.rowcount > 0
+
+
+class ReplicaReadMixin:
+    """Отправляет чтения в реплики БД.
+
+    Читающий запрос идёт в реплику, если пользователь не закреплён за
+    основной базой. Закрепление наступает после каждого его успешного
+    изменения данных.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        token = replica_reads.set(False)
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            replica_reads.reset(token)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        user = request.user
+        if (
+            request.method in SAFE_METHODS and settings.DATABASE_REPLICAS
+            and not (
+                user.is_authenticated
+                and is_pinned_to_primary(request, user.id)
+            )
+        ):
+            replica_reads.set(True)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        if (
+            request.method not in SAFE_METHODS and settings.DATABASE_REPLICAS
+            and response.status_code < status.HTTP_400_BAD_REQUEST
+            and request.user.is_authenticated
+        ):
+            pin_to_primary(response, request.user.id)
+        return super().finalize_response(request, response, *args, **kwargs)
 
 
-class UsersViewSet(UserViewSet):
+class UsersViewSet(ProfiledViewMixin, ReplicaReadMixin, UserViewSet):
     """Реализовывает подписки пользователя."""
 
     queryset = User.objects.all()
     serializer_class = UsersSerializer
     pagination_class = CustomPagination
     permission_classes = [IsAuthenticated]
+    cursor_ordering = ('username', 'id')
+
+    def get_queryset(self):
+        return super().get_queryset().with_is_subscribed(self.request.user)
 
     @action(
         detail=True, methods=['post', 'delete'],
         permission_classes=[IsAuthenticated],
     )
+    @atomic
     def subscribe(self, request, **kwargs):
         id = self.kwargs.get('id')
         author = get_object_or_404(User, id=id)
-        serializer = FollowSerializer(
-            data={'user': request.user.id, 'author': author.id}
-        )
 
         if request.method == 'POST':
             serializer = FollowSerializer(
@@ -46,12 +150,24 @@ class UsersViewSet(UserViewSet):
                 context={'request': request}
             )
             serializer.is_valid(raise_exception=True)
-            Follow.objects.create(user=request.user, author=author)
+            if not create_ignoring_conflicts(
+                Follow, user=request.user, author=author
+            ):
+                raise ValidationError({
+                    api_settings.NON_FIELD_ERRORS_KEY: ['Подписка уже есть.']
+                })
+            FeedEntry.objects.follow(request.user, author)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
-        subscription = get_object_or_404(Follow,
-                                         user=request.user, author=author)
-        self.perform_destroy(subscription)
+        deleted, _ = Follow.objects.filter(
+            user=request.user, author=author
+        ).delete()
+        if not deleted:
+            return Response(
+                {'errors': 'Вы не подписаны на этого автора.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        FeedEntry.objects.unfollow(request.user, author)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(
@@ -59,15 +175,26 @@ class UsersViewSet(UserViewSet):
         permission_classes=[IsAuthenticated],
     )
     def subscriptions(self, request):
-        queryset = User.objects.filter(following__user=request.user)
+        queryset = User.objects.filter(
+            following__user=request.user
+        ).with_is_subscribed(request.user).annotate(
+            recipes_count=Count('recipes')
+        ).order_by('username')
         subscriptions = self.paginate_queryset(queryset)
+        latest_recipes = Recipe.objects.latest_by_author(
+            [author.id for author in subscriptions],
+            get_recipes_limit(request),
+        )
+        for author in subscriptions:
+            author.latest_recipes = latest_recipes[author.id]
         serializer = FollowSerializer(
             subscriptions, many=True, context={'request': request}
         )
         return self.get_paginated_response(serializer.data)
 
 
-class IngredientViewSet(viewsets.ModelViewSet):
+class IngredientViewSet(ProfiledViewMixin, ReplicaReadMixin,
+                        CachedReferenceMixin, viewsets.ModelViewSet):
     """Работа с ингредиентами."""
 
     queryset = Ingredient.objects.all()
@@ -75,17 +202,45 @@ class IngredientViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAdminOrReadOnly]
     filter_backends = [DjangoFilterBackend]
     filterset_class = IngredientsSearchFilter
+    cache_namespace = 'ingredients'
 
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if name:
+            return self.cached_response(
+                request, lambda: Response(ingredient_index.search(name)),
+                *args, **kwargs
+            )
+        return super().list(request, *args, **kwargs)
 
-class TagViewSet(viewsets.ModelViewSet):
+
+class TagViewSet(ProfiledViewMixin, ReplicaReadMixin, CachedReferenceMixin,
+                 viewsets.ModelViewSet):
     """Работа с тегами."""
 
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = [IsAdminOrReadOnly]
+    cache_namespace = 'tags'
+
 
+def get_ingredient_ids(request):
+    """id ингредиентов из параметра ingredients (через запятую или
+    повтором параметра) или None, если список пуст или неверен."""
+    values = [
+        value
+        for param in request.query_params.getlist('ingredients')
+        for value in param.split(',') if value.strip()
+    ]
+    if not values or len(values) > COOKABLE_MAX_INGREDIENTS or not all(
+        value.strip().isdecimal() for value in values
+    ):
+        return None
+    return {int(value) for value in values}
 
-class RecipeViewSet(viewsets.ModelViewSet):
+
+class RecipeViewSet(ProfiledViewMixin, ReplicaReadMixin,
+                    viewsets.ModelViewSet):
     """Работа с рецептами."""
 
     queryset = Recipe.objects.all()
@@ -94,39 +249,169 @@ class RecipeViewSet(viewsets.ModelViewSet):
     pagination_class = CustomPagination
     filter_backends = [DjangoFilterBackend]
     filterset_class = RecipeFilter
+    parser_classes = [JSONParser, MultiPartParser]
+    cookable_ordering = ('missing_count', '-matched_count', '-pub_date', '-id')
+
+    def initialize_request(self, request, *args, **kwargs):
+        # Файл изображения пишется во временный файл по частям, а не
+        # собирается в памяти, и загрузка обрывается сверх лимита размера.
+        request.upload_handlers = [LimitedTemporaryFileUploadHandler(request)]
+        return super().initialize_request(request, *args, **kwargs)
+
+    def get_queryset(self):
+        return Recipe.objects.for_viewer(self.request.user)
+
+    @property
+    def cursor_ordering(self):
+        if self.action == 'cookable':
+            return self.cookable_ordering
+        if self.request.query_params.get('ordering') == 'popular':
+            return RecipeFilter.popular_ordering
+        if self.request.query_params.get('search', '').strip():
+            return RecipeFilter.search_ordering
+        return CustomPagination.cursor_ordering
 
     def get_serializer_class(self):
         if self.request.method in SAFE_METHODS:
             return RecipeSerializer
         return CreateRecipeSerializer
 
+    @atomic
+    def perform_destroy(self, instance):
+        # Суммы списков покупок пересчитывает сигнал pre_delete рецепта.
+        with batch_invalidations():
+            instance.delete()
+
     def add_method(self, model, request, pk):
-        if model.objects.filter(user=request.user, recipe__id=pk).exists():
+        recipe = get_object_or_404(Recipe, id=pk)
+        lock_user(request.user)
+        if not create_ignoring_conflicts(
+            model, user=request.user, recipe=recipe
+        ):
             return Response(
                 {'Уже существует.'},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        recipe = get_object_or_404(Recipe, id=pk)
-        model.objects.create(user=request.user, recipe=recipe)
+        counter = RECIPE_COUNTERS[model]
+        Recipe.objects.filter(id=pk).update(**{counter: F(counter) + 1})
         serializer = ShortRecipeSerializer(recipe)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     def delete_method(self, model, request, pk):
-        objects = model.objects.filter(user=request.user, recipe__id=pk)
-        if objects.exists():
-            objects.delete()
+        lock_user(request.user)
+        deleted, _ = model.objects.filter(
+            user=request.user, recipe_id=pk
+        ).delete()
+        if deleted:
+            counter = RECIPE_COUNTERS[model]
+            Recipe.objects.filter(id=pk).update(
+                **{counter: F(counter) - deleted}
+            )
             return Response(status=status.HTTP_204_NO_CONTENT)
         return Response({'errors': 'Не найден.'},
                         status=status.HTTP_400_BAD_REQUEST)
 
+    def bulk_method(self, model, request):
+        """Добавляет (POST), удаляет (DELETE) или заменяет (PUT) набор
+        рецептов одной вставкой и одним удалением.
+
+        Возвращает id добавленных и удалённых рецептов и ответ с итогом
+        по каждому id.
+        """
+        serializer = BulkRecipesSerializer(
+            data=request.data, context={'request': request}
+        )
+        serializer.is_valid(raise_exception=True)
+        recipe_ids = serializer.validated_data['recipes']
+        user = request.user
+        lock_user(user)
+        objects = model.objects.filter(user=user)
+        if request.method != 'PUT':
+            objects = objects.filter(recipe_id__in=recipe_ids)
+        existing = set(objects.values_list('recipe_id', flat=True))
+        if request.method == 'DELETE':
+            found = existing
+        else:
+            found = set(Recipe.objects.filter(
+                id__in=recipe_ids
+            ).values_list('id', flat=True))
+
+        results, added, removed = [], [], []
+        for recipe_id in recipe_ids:
+            if recipe_id not in found:
+                result = 'not_found'
+            elif request.method == 'DELETE':
+                result = 'removed'
+                removed.append(recipe_id)
+            elif recipe_id in existing:
+                result = 'exists'
+            else:
+                result = 'added'
+                added.append(recipe_id)
+            results.append({'id': recipe_id, 'result': result})
+        if request.method == 'PUT':
+            removed = sorted(existing - set(recipe_ids))
+            results += [
+                {'id': recipe_id, 'result': 'removed'} for recipe_id in removed
+            ]
+
+        counter = RECIPE_COUNTERS[model]
+        if removed:
+            model.objects.filter(user=user, recipe_id__in=removed).delete()
+            Recipe.objects.filter(id__in=removed).update(
+                **{counter: F(counter) - 1}
+            )
+        if added:
+            model.objects.bulk_create(
+                [model(user=user, recipe_id=recipe_id) for recipe_id in added],
+                ignore_conflicts=True,
+            )
+            Recipe.objects.filter(id__in=added).update(
+                **{counter: F(counter) + 1}
+            )
+        return added, removed, Response({'results': results})
+
     @action(
         detail=True, methods=['post', 'delete'],
         permission_classes=[IsAuthenticated]
     )
+    @atomic
     def shopping_cart(self, request, pk):
         if request.method == 'POST':
-            return self.add_method(ShoppingCart, request, pk)
-        return self.delete_method(ShoppingCart, request, pk)
+            response = self.add_method(ShoppingCart, request, pk)
+            if response.status_code == status.HTTP_201_CREATED:
+                ShoppingCartIngredient.objects.add_recipe(
+                    request.user, int(pk)
+                )
+            return response
+        response = self.delete_method(ShoppingCart, request, pk)
+        if response.status_code == status.HTTP_204_NO_CONTENT:
+            ShoppingCartIngredient.objects.remove_recipe(
+                request.user, int(pk)
+            )
+        return response
+
+    @action(
+        detail=False, methods=['post', 'put', 'delete'],
+        url_path='shopping_cart', url_name='shopping-cart-bulk',
+        permission_classes=[IsAuthenticated]
+    )
+    @atomic
+    def shopping_cart_bulk(self, request):
+        added, removed, response = self.bulk_method(ShoppingCart, request)
+        ShoppingCartIngredient.objects.change_recipes(
+            request.user, added, removed
+        )
+        return response
+
+    @action(
+        detail=False, methods=['post', 'put', 'delete'],
+        url_path='favorite', url_name='favorite-bulk',
+        permission_classes=[IsAuthenticated]
+    )
+    @atomic
+    def favorite_bulk(self, request):
+        return self.bulk_method(Favorite, request)[2]
 
     @action(
         detail=False, permission_classes=[IsAuthenticated]
@@ -134,10 +419,60 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def download_shopping_cart(self, request):
         return download_shopping_cart(self, request)
 
+    @action(detail=False, permission_classes=[IsAuthenticated])
+    def feed(self, request):
+        """Рецепты авторов из подписок, новые сначала.
+
+        Листается только вперёд по курсору из ссылки next.
+        """
+        paginator = self.paginator
+        paginator.request = request
+        paginator.ordering = paginator.cursor_ordering
+        position, _ = paginator.decode_cursor(request)
+        limit = paginator.get_page_size(request)
+        recipe_ids = FeedEntry.objects.page_ids(
+            request.user, position, limit + 1
+        )
+        recipes = list(self.get_queryset().filter(
+            id__in=recipe_ids
+        ).order_by(*paginator.ordering))
+        next_position = None
+        if len(recipes) > limit:
+            recipes = recipes[:limit]
+            next_position = paginator.get_position(recipes[-1])
+        serializer = self.get_serializer(recipes, many=True)
+        return Response(OrderedDict([
+            ('next', paginator.get_cursor_link(next_position, False)),
+            ('results', serializer.data),
+        ]))
+
+    @action(detail=False)
+    def cookable(self, request):
+        """Рецепты из имеющихся ингредиентов: сначала те, для которых
+        есть всё, затем с наименьшим числом недостающих."""
+        ingredient_ids = get_ingredient_ids(request)
+        if not ingredient_ids:
+            return Response(
+                {'ingredients': [
+                    'Передайте от 1 до '
+                    f'{COOKABLE_MAX_INGREDIENTS} id ингредиентов.'
+                ]},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        queryset = self.filter_queryset(self.get_queryset()).cookable_with(
+            ingredient_ids
+        ).order_by(*self.cookable_ordering)
+        page = self.paginate_queryset(queryset)
+        serializer = CookableRecipeSerializer(
+            page, many=True, context=self.get_serializer_context()
+        )
+        return self.get_paginated_response(serializer.data)
+
     @action(
         detail=True, methods=['post', 'delete'],
         permission_classes=[IsAuthenticated]
     )
+    @atomic
     def favorite(self, request, pk):
         if request.method == 'POST':
             return self.add_method(Favorite, request, pk)
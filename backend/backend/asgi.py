@@ -1,7 +1,16 @@
 import os
 
-from django.core.asgi import get_asgi_application
+import django
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+os.environ.setdefault('ASYNC_READ_VIEWS', '1')
 
-application = get_asgi_application()
+
+def get_application():
+    django.setup(set_prefix=False)
+    from api.async_views import StreamingASGIHandler
+
+    return StreamingASGIHandler()
+
+
+application = get_application()
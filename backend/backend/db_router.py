@@ -0,0 +1,84 @@
+"""Чтение из реплик БД.
+
+Запросы идут в реплики только внутри use_replicas(): его включают
+читающие представления API. Всё остальное, включая записи, миграции и
+фоновые задачи, работает с основной базой. Пользователь, который сам
+что-то изменил, REPLICA_PIN_SECONDS читает из основной базы, чтобы
+увидеть свои изменения раньше, чем их получат реплики. Отметка об этом
+хранится в подписанной cookie: её, в отличие от записи в кэше, не
+вытеснит переполнение кэша.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PIN_COOKIE = 'primary_pin'
+PIN_SALT = 'backend.db_router.pin'
+
+replica_reads = ContextVar('replica_reads', default=False)
+
+
+@contextmanager
+def use_replicas(enabled=True):
+    token = replica_reads.set(enabled)
+    try:
+        yield
+    finally:
+        replica_reads.reset(token)
+
+
+def use_primary():
+    """Читать из основной базы, например чтобы заполнить кэш, который
+    сбрасывается при записи: данные из отстающей реплики остались бы
+    в нём до следующего сброса."""
+    return use_replicas(False)
+
+
+def pin_to_primary(response, user_id):
+    response.set_signed_cookie(
+        PIN_COOKIE, str(user_id), salt=PIN_SALT,
+        max_age=settings.REPLICA_PIN_SECONDS, httponly=True, samesite='Lax',
+    )
+
+
+def is_pinned_to_primary(request, user_id):
+    # Срок действия проверяется по подписанной метке времени, а не по
+    # сроку cookie, который задаёт клиент.
+    return request.get_signed_cookie(
+        PIN_COOKIE, default=None, salt=PIN_SALT,
+        max_age=settings.REPLICA_PIN_SECONDS,
+    ) == str(user_id)
+
+
+def close_unusable_connections():
+    """Закрывает постоянные соединения, которые перестали отвечать.
+
+    В Django 3.2 нет CONN_HEALTH_CHECKS, и без проверки первый запрос
+    после перезапуска БД или обрыва сети падал бы на старом соединении.
+    """
+    if not settings.DB_CONN_HEALTH_CHECKS:
+        return
+    for connection in connections.all():
+        if connection.connection is not None and not connection.is_usable():
+            connection.close()
+
+
+class ReplicaRouter:
+    """Отправляет чтения внутри use_replicas() в случайную реплику."""
+
+    def db_for_read(self, model, **hints):
+        if settings.DATABASE_REPLICAS and replica_reads.get():
+            return random.choice(settings.DATABASE_REPLICAS)
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
@@ -1,4 +1,5 @@
 import os
+import tempfile
 from pathlib import Path
 
 from dotenv import load_dotenv
@@ -38,6 +39,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.timing.TimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -75,9 +77,55 @@ DATABASES = {
         'USER': os.getenv('POSTGRES_USER', default='postgres'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', default='postgres'),
         'HOST': os.getenv('DB_HOST', default='db'),
-        'PORT': os.getenv('DB_PORT', default='5432')
+        'PORT': os.getenv('DB_PORT', default='5432'),
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', default=60)),
     }
 }
+DB_CONN_HEALTH_CHECKS = os.getenv('DB_CONN_HEALTH_CHECKS', default='1') == '1'
+
+# Реплики для чтения: хосты PostgreSQL (или файлы SQLite) через запятую.
+DATABASE_REPLICAS = []
+for number, replica in enumerate(
+    filter(None, os.getenv('DB_REPLICAS', default='').split(',')), 1
+):
+    alias = f'replica_{number}'
+    location = 'NAME' if DATABASES['default']['ENGINE'].endswith(
+        'sqlite3'
+    ) else 'HOST'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        location: replica.strip(),
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(alias)
+DATABASE_ROUTERS = ['backend.db_router.ReplicaRouter']
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', default=10))
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.getenv(
+            'CACHE_LOCATION',
+            default=os.path.join(tempfile.gettempdir(), 'foodgram_cache')),
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    # Документы рецептов: по записи на рецепт, поэтому отдельно от
+    # файлового кэша, который при переполнении вытесняет треть записей.
+    'recipe-documents': {
+        'BACKEND': os.getenv(
+            'RECIPE_CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv(
+            'RECIPE_CACHE_LOCATION', default='recipe-documents'),
+        'OPTIONS': {'MAX_ENTRIES': int(
+            os.getenv('RECIPE_CACHE_MAX_ENTRIES', default=50000))},
+    },
+}
+
+REFERENCE_CACHE_TIMEOUT = 60 * 60
+RECIPE_DOCUMENT_TIMEOUT = 60 * 60 * 24
 
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': ('django.contrib.auth.password_validation'
@@ -128,3 +176,50 @@ DJOSER = {
         'user_list': ['rest_framework.permissions.AllowAny']}}
 
 PAGINATION_SIZE = 6
+
+# Сколько ингредиентов отдаёт автодополнение по ?name=.
+INGREDIENT_SEARCH_LIMIT = 50
+
+BULK_RECIPES_MAX = 100
+
+FEED_LENGTH = 500
+FEED_FANOUT_LIMIT = 1000
+FEED_POPULAR_AUTHORS_TTL = 300
+FEED_BATCH_SIZE = 1000
+
+SHOPPING_LIST_PDF_FONT = os.getenv(
+    'SHOPPING_LIST_PDF_FONT',
+    default='/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf')
+
+# Асинхронные обёртки читающих представлений API; их включает точка
+# входа ASGI (backend/asgi.py).
+ASYNC_READ_VIEWS = os.getenv('ASYNC_READ_VIEWS', default='0') == '1'
+ASYNC_READ_WORKERS = int(os.getenv('ASYNC_READ_WORKERS', default=32))
+
+RECIPE_IMAGE_ASYNC = True
+RECIPE_IMAGE_WORKERS = 2
+RECIPE_IMAGE_MAX_SIZE = 10 * 1024 * 1024
+RECIPE_IMAGE_RENDITIONS = {
+    'small': 320,
+    'medium': 640,
+    'large': 1280,
+}
+
+# Замеры запросов: гистограммы /api/metrics/ (файлы воркеров складываются
+# в METRICS_DIR) и профили медленных запросов из доли PROFILE_SAMPLE_RATE.
+METRICS_DIR = os.getenv(
+    'METRICS_DIR',
+    default=os.path.join(tempfile.gettempdir(), 'foodgram_metrics'))
+METRICS_FLUSH_INTERVAL = 5
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', default='')
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', default=0))
+PROFILE_SLOW_MS = int(os.getenv('PROFILE_SLOW_MS', default=500))
+PROFILE_DIR = os.getenv(
+    'PROFILE_DIR',
+    default=os.path.join(tempfile.gettempdir(), 'foodgram_profiles'))
+
+# Поиск N+1: запросы одной формы, выполненные за запрос API больше
+# NPLUSONE_THRESHOLD раз, пишутся в лог, а с NPLUSONE_RAISE роняют запрос.
+NPLUSONE_DETECTION = os.getenv('NPLUSONE_DETECTION', default='0') == '1'
+NPLUSONE_THRESHOLD = int(os.getenv('NPLUSONE_THRESHOLD', default=3))
+NPLUSONE_RAISE = os.getenv('NPLUSONE_RAISE', default='0') == '1'
@@ -0,0 +1,26 @@
+"""Версии справочников в общем кэше.
+
+Версия — время последнего изменения справочника. Её поднимают сигналы
+и команды загрузки в любом процессе, а читают кэши ответов API и
+индексы в памяти, чтобы понять, что их данные устарели. Модуль не
+зависит от приложений проекта, поэтому его импортируют и api, и recipes.
+"""
+import time
+
+from django.core.cache import cache
+
+VERSION_KEY = 'reference-version:{}'
+
+
+def get_version(namespace):
+    """Версия справочника: время его последнего изменения."""
+    version = cache.get(VERSION_KEY.format(namespace))
+    if version is None:
+        version = time.time()
+        cache.add(VERSION_KEY.format(namespace), version, timeout=None)
+    return version
+
+
+def bump_version(namespace):
+    """Делает все закэшированные ответы справочника устаревшими."""
+    cache.set(VERSION_KEY.format(namespace), time.time(), timeout=None)
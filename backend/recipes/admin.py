@@ -1,8 +1,9 @@
 from django.contrib import admin
-from django.contrib.admin import display
+from django.db.transaction import atomic
 
 from .models import (Favorite, Ingredient, IngredientRecipe, Recipe,
-                     ShoppingCart, Tag)
+                     ShoppingCart, ShoppingCartIngredient, Tag)
+from .search import update_search_index
 
 
 class IngredientRecipeInline(admin.TabularInline):
@@ -16,14 +17,22 @@ class IngredientRecipeInline(admin.TabularInline):
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
     inlines = (IngredientRecipeInline,)
-    list_display = ('id', 'name', 'author', 'favorite_count')
-    readonly_fields = ('favorite_count',)
+    list_display = ('id', 'name', 'author', 'favorites_count')
+    readonly_fields = ('favorites_count', 'in_carts_count')
     list_filter = ('author', 'name', 'tags')
     filter_horizontal = ('ingredients',)
 
-    @display(description='Добавлено в избранное')
-    def favorite_count(self, obj):
-        return obj.in_favorite.count()
+    def save_related(self, request, form, formsets, change):
+        # Состав меняется формами ингредиентов; суммы в списках покупок
+        # пересчитываются по разнице со старым составом.
+        recipe_id = form.instance.id
+        old_amounts = ShoppingCartIngredient.objects.recipe_amounts(recipe_id)
+        super().save_related(request, form, formsets, change)
+        ShoppingCartIngredient.objects.change_recipe(
+            recipe_id, old_amounts,
+            ShoppingCartIngredient.objects.recipe_amounts(recipe_id),
+        )
+        update_search_index([recipe_id])
 
 
 @admin.register(Ingredient)
@@ -40,9 +49,38 @@ class TagAdmin(admin.ModelAdmin):
 
 @admin.register(ShoppingCart)
 class ShoppingCartAdmin(admin.ModelAdmin):
+    """Изменения списков покупок сразу учитываются в их суммах."""
+
     list_display = ('user', 'recipe')
     list_filter = ('user',)
 
+    def save_model(self, request, obj, form, change):
+        if change:
+            old = ShoppingCart.objects.get(pk=obj.pk)
+            ShoppingCartIngredient.objects.remove_recipe(
+                old.user, old.recipe_id
+            )
+        super().save_model(request, obj, form, change)
+        ShoppingCartIngredient.objects.add_recipe(obj.user, obj.recipe_id)
+
+    def delete_model(self, request, obj):
+        ShoppingCartIngredient.objects.remove_recipe(obj.user, obj.recipe_id)
+        super().delete_model(request, obj)
+
+    @atomic
+    def delete_queryset(self, request, queryset):
+        for obj in queryset.select_related('user'):
+            ShoppingCartIngredient.objects.remove_recipe(
+                obj.user, obj.recipe_id
+            )
+        super().delete_queryset(request, queryset)
+
+
+@admin.register(ShoppingCartIngredient)
+class ShoppingCartIngredientAdmin(admin.ModelAdmin):
+    list_display = ('user', 'ingredient', 'amount')
+    list_filter = ('user',)
+
 
 @admin.register(Favorite)
 class FavoriteAdmin(admin.ModelAdmin):
@@ -52,5 +90,31 @@ class FavoriteAdmin(admin.ModelAdmin):
 
 @admin.register(IngredientRecipe)
 class IngredientForRecipesAdmin(admin.ModelAdmin):
+    """Изменения состава сразу учитываются в суммах списков покупок."""
+
     list_display = ('recipe', 'ingredient', 'amount')
     list_filter = ('recipe', 'ingredient')
+
+    @staticmethod
+    def remove_from_carts(row):
+        ShoppingCartIngredient.objects.change_recipe(
+            row.recipe_id, {row.ingredient_id: row.amount}, {}
+        )
+
+    def save_model(self, request, obj, form, change):
+        if change:
+            self.remove_from_carts(IngredientRecipe.objects.get(pk=obj.pk))
+        super().save_model(request, obj, form, change)
+        ShoppingCartIngredient.objects.change_recipe(
+            obj.recipe_id, {}, {obj.ingredient_id: obj.amount}
+        )
+
+    def delete_model(self, request, obj):
+        self.remove_from_carts(obj)
+        super().delete_model(request, obj)
+
+    @atomic
+    def delete_queryset(self, request, queryset):
+        for row in queryset:
+            self.remove_from_carts(row)
+        super().delete_queryset(request, queryset)
@@ -0,0 +1,184 @@
+import hashlib
+import logging
+import os.path
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.db import connections, transaction
+from PIL import Image, UnidentifiedImageError
+from rest_framework.exceptions import ValidationError
+
+logger = logging.getLogger(__name__)
+
+IMAGE_DIR = 'recipes/images/'
+RENDITION_FORMATS = {
+    'webp': 'WEBP',
+    'jpeg': 'JPEG',
+}
+TOO_LARGE_MESSAGE = 'Размер изображения превышает допустимый.'
+# Служебные ключи image_renditions: метка готовых копий и метка
+# изображения, которое ещё обрабатывается.
+RENDITION_META_KEYS = ('token', 'pending')
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.RECIPE_IMAGE_WORKERS,
+    thread_name_prefix='recipe-images',
+)
+
+
+class LimitedTemporaryFileUploadHandler(TemporaryFileUploadHandler):
+    """Пишет загружаемый файл во временный файл по частям.
+
+    Загрузка обрывается, как только размер файла превысит
+    RECIPE_IMAGE_MAX_SIZE.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > settings.RECIPE_IMAGE_MAX_SIZE:
+            self.file.close()
+            raise ValidationError({self.field_name: [TOO_LARGE_MESSAGE]})
+        return super().receive_data_chunk(raw_data, start)
+
+
+def check_image_header(file):
+    """Формат изображения по заголовку файла или None, если это не
+    изображение. Содержимое целиком здесь не читается."""
+    try:
+        image_format = Image.open(file).format
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError,
+            ValueError):
+        image_format = None
+    file.seek(0)
+    return image_format
+
+
+def image_digest(image):
+    """Хеш содержимого файла изображения."""
+    digest = hashlib.sha256()
+    for chunk in image.chunks():
+        digest.update(chunk)
+    image.seek(0)
+    return digest.hexdigest()[:32]
+
+
+def rendition_files(renditions):
+    return [
+        path
+        for size_name, paths in renditions.items()
+        if size_name not in RENDITION_META_KEYS
+        for path in paths.values()
+    ]
+
+
+def delete_image_files(original, renditions):
+    for path in [original, *rendition_files(renditions)]:
+        if path:
+            default_storage.delete(path)
+
+
+def schedule_recipe_image(recipe, image):
+    """Ставит обработку изображения рецепта в очередь после коммита.
+
+    image — проверенный файл изображения. Он сразу копируется в хранилище
+    по частям: временный файл удаляется вместе с запросом. Хеш содержимого
+    записывается в image_renditions под ключом pending, а прежние копии
+    остаются доступными до конца обработки. Метка позволяет отбросить
+    результат устаревшей задачи, если изображение успели заменить, и не
+    обрабатывать заново то же самое изображение. Возвращает False, если
+    изображение не изменилось.
+    """
+    token = image_digest(image)
+    if recipe.image_renditions.get('token') == token:
+        return False
+    recipe.image_renditions = {**recipe.image_renditions, 'pending': token}
+    type(recipe).objects.filter(pk=recipe.pk).update(
+        image_renditions=recipe.image_renditions
+    )
+    extension = os.path.splitext(image.name)[1].lower()
+    original = default_storage.save(f'{IMAGE_DIR}{token}{extension}', image)
+    job = partial(process_recipe_image, recipe.pk, token, original)
+
+    def submit():
+        if settings.RECIPE_IMAGE_ASYNC:
+            executor.submit(run_job, job, recipe.pk)
+        else:
+            run_job(job, recipe.pk)
+            recipe.refresh_from_db(fields=['image', 'image_renditions'])
+
+    transaction.on_commit(submit)
+    return True
+
+
+def run_job(job, recipe_id):
+    try:
+        job()
+    except (ValueError, UnidentifiedImageError, OSError):
+        logger.warning('Не удалось обработать изображение рецепта %s.',
+                       recipe_id, exc_info=True)
+    except Exception:
+        logger.exception('Ошибка обработки изображения рецепта %s.',
+                         recipe_id)
+    finally:
+        if settings.RECIPE_IMAGE_ASYNC:
+            # Соединения с БД у потоков пула свои и сами не закрываются.
+            connections.close_all()
+
+
+def process_recipe_image(recipe_id, token, original):
+    """Проверяет сохранённый оригинал и строит уменьшенные копии."""
+    from recipes.models import Recipe
+
+    try:
+        with default_storage.open(original) as file:
+            Image.open(file).verify()
+        with default_storage.open(original) as file:
+            image = Image.open(file)
+            image.load()
+    except Exception:
+        default_storage.delete(original)
+        raise
+    renditions = {'token': token}
+    for size_name, width in settings.RECIPE_IMAGE_RENDITIONS.items():
+        renditions[size_name] = save_rendition(image, token, size_name, width)
+    with transaction.atomic():
+        replaced = Recipe.objects.select_for_update().filter(
+            pk=recipe_id, image_renditions__pending=token
+        ).values_list('image', 'image_renditions').first()
+        if replaced is not None:
+            Recipe.objects.filter(pk=recipe_id).update(
+                image=original, image_renditions=renditions
+            )
+    if replaced is None:
+        logger.info('Изображение рецепта %s устарело.', recipe_id)
+        delete_image_files(original, renditions)
+    else:
+        delete_image_files(*replaced)
+
+
+def save_rendition(image, token, size_name, width):
+    """Сохраняет уменьшенную копию изображения во всех форматах."""
+    resized = image.convert('RGB')
+    if resized.width > width:
+        resized = resized.resize(
+            (width, round(resized.height * width / resized.width)),
+            Image.LANCZOS,
+        )
+    paths = {}
+    for extension, image_format in RENDITION_FORMATS.items():
+        buffer = BytesIO()
+        resized.save(buffer, image_format, quality=85)
+        paths[extension] = default_storage.save(
+            f'{IMAGE_DIR}{token}_{size_name}.{extension}',
+            ContentFile(buffer.getvalue()),
+        )
+    return paths
@@ -0,0 +1,90 @@
+from bisect import bisect_left
+from itertools import islice
+from threading import Lock
+
+from django.conf import settings
+
+from backend.db_router import use_primary
+from backend.versions import get_version
+
+
+def normalize(value):
+    """Приводит строку к виду для сравнения без учёта регистра и ё."""
+    return value.lower().replace('ё', 'е')
+
+
+class IngredientIndex:
+    """Индекс ингредиентов в памяти процесса для автодополнения.
+
+    Хранит отсортированные нормализованные названия и готовые ответы API.
+    Строится при первом обращении и перестраивается, когда меняется
+    версия справочника ингредиентов в общем кэше: её поднимают сигналы
+    и load_ingredients в любом процессе. Так индекс не отстаёт от
+    закэшированных по этой версии ответов.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._state = None
+
+    def invalidate(self):
+        self._state = None
+
+    def build(self, version):
+        from recipes.models import Ingredient
+
+        with use_primary():
+            rows = sorted(
+                (normalize(name), pk, name, measurement_unit)
+                for pk, name, measurement_unit
+                in Ingredient.objects.values_list(
+                    'id', 'name', 'measurement_unit'
+                )
+            )
+        keys = [key for key, *_ in rows]
+        entries = [
+            {'id': pk, 'name': name, 'measurement_unit': measurement_unit}
+            for _, pk, name, measurement_unit in rows
+        ]
+        return version, keys, entries
+
+    def get_state(self):
+        # Версия читается до построения: изменение во время построения
+        # поднимет её, и следующий поиск перестроит индекс.
+        version = get_version('ingredients')
+        state = self._state
+        if state is not None and state[0] == version:
+            return state
+        with self._lock:
+            if self._state is None or self._state[0] != version:
+                self._state = self.build(version)
+            return self._state
+
+    def search(self, query, limit=None):
+        """Сначала совпадения по началу названия, затем по подстроке.
+
+        Отдаёт не больше limit (по умолчанию INGREDIENT_SEARCH_LIMIT)
+        ингредиентов: поиск по подстроке останавливается, как только
+        их набралось достаточно.
+        """
+        if limit is None:
+            limit = settings.INGREDIENT_SEARCH_LIMIT
+        _, keys, entries = self.get_state()
+        query = normalize(query)
+        start = bisect_left(keys, query)
+        end = start
+        while end < len(keys) and end - start < limit and (
+            keys[end].startswith(query)
+        ):
+            end += 1
+        substring = islice(
+            (
+                entry for key, entry in zip(keys, entries)
+                if query in key and not key.startswith(query)
+            ),
+            limit - (end - start),
+        )
+        return entries[start:end] + list(substring)
+
+
+ingredient_index = IngredientIndex()
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.models import ShoppingCartIngredient
+
+
+class Command(BaseCommand):
+    help = 'Сверяет сводные списки покупок со списками покупок.'
+
+    def handle(self, *args, **options):
+        mismatches = ShoppingCartIngredient.objects.inconsistencies()
+        for (user_id, ingredient_id), (stored, expected) in sorted(
+            mismatches.items()
+        ):
+            self.stdout.write(
+                f'Пользователь {user_id}, ингредиент {ingredient_id}: '
+                f'сохранено {stored}, ожидается {expected}.'
+            )
+        if mismatches:
+            raise CommandError(
+                f'Расхождений: {len(mismatches)}. '
+                'Запустите rebuild_cart_totals.'
+            )
+        self.stdout.write('Расхождений нет.')
@@ -1,25 +1,135 @@
-﻿import csv
+import csv
+import json
 import os.path
+from itertools import islice
 
 from django.conf import settings
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 
+from backend.versions import bump_version
 from recipes.models import Ingredient
 
 DATA_ROOT = os.path.join(settings.BASE_DIR, 'data')
 
+NAME_MAX_LENGTH = Ingredient._meta.get_field('name').max_length
+UNIT_MAX_LENGTH = Ingredient._meta.get_field('measurement_unit').max_length
+
+
+def read_object(row):
+    """Название и единица измерения из объекта JSON.
+
+    Строка, которая не является объектом, и поля не строкового типа
+    (в том числе null) дают пустые значения: clean() посчитает такую
+    строку ошибочной.
+    """
+    if not isinstance(row, dict):
+        return '', ''
+    return tuple(
+        value if isinstance(value, str) else ''
+        for value in (row.get('name'), row.get('measurement_unit'))
+    )
+
 
 class Command(BaseCommand):
+    help = (
+        'Загружает ингредиенты из CSV, JSON или JSON Lines пакетами, '
+        'пропуская уже существующие.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?',
+            default=os.path.join(DATA_ROOT, 'ingredients.csv'),
+        )
+        parser.add_argument(
+            '--format', choices=['csv', 'json', 'jsonl'],
+            help='По умолчанию определяется по расширению файла.',
+        )
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только посчитать, ничего не записывая.',
+        )
 
     def handle(self, *args, **options):
-        self.import_ingredients('ingredients.csv')
-        print('Загрузка завершена.')
-
-    def import_ingredients(self, file):
-        file_path = os.path.join(DATA_ROOT, file)
-        with open(file_path, newline='', encoding='utf-8') as file:
-            reader = csv.reader(file)
-            for row in reader:
-                status, created = Ingredient.objects.update_or_create(
-                    name=row[0],
-                    measurement_unit=row[1])
+        path = options['path']
+        file_format = options['format'] or os.path.splitext(path)[1][1:]
+        readers = {
+            'csv': self.read_csv,
+            'json': self.read_json,
+            'jsonl': self.read_jsonl,
+        }
+        if file_format not in readers:
+            raise CommandError(f'Неизвестный формат файла: {path}')
+        self.counts = {'inserted': 0, 'skipped': 0, 'invalid': 0}
+        self.planned = set()
+        with open(path, newline='', encoding='utf-8-sig') as file:
+            rows = self.clean(readers[file_format](file))
+            while True:
+                batch = list(islice(rows, options['batch_size']))
+                if not batch:
+                    break
+                self.import_batch(batch, options['dry_run'])
+        if self.counts['inserted'] and not options['dry_run']:
+            # bulk_create не отправляет сигналы post_save.
+            bump_version('ingredients')
+        self.stdout.write(
+            'Загрузка завершена. '
+            f'Добавлено: {self.counts["inserted"]}, '
+            f'пропущено: {self.counts["skipped"]}, '
+            f'с ошибками: {self.counts["invalid"]}.'
+        )
+
+    def read_csv(self, file):
+        for row in csv.reader(file):
+            yield row[0] if row else '', row[1] if len(row) > 1 else ''
+
+    def read_json(self, file):
+        rows = json.load(file)
+        if not isinstance(rows, list):
+            raise CommandError('В JSON-файле ожидается список ингредиентов.')
+        for row in rows:
+            yield read_object(row)
+
+    def read_jsonl(self, file):
+        for line in file:
+            if line.strip():
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    row = None
+                yield read_object(row)
+
+    def clean(self, rows):
+        for name, measurement_unit in rows:
+            name, measurement_unit = name.strip(), measurement_unit.strip()
+            if (
+                not name or not measurement_unit
+                or len(name) > NAME_MAX_LENGTH
+                or len(measurement_unit) > UNIT_MAX_LENGTH
+            ):
+                self.counts['invalid'] += 1
+                continue
+            yield name, measurement_unit
+
+    def import_batch(self, batch, dry_run):
+        keys = set(batch)
+        self.counts['skipped'] += len(batch) - len(keys)
+        existing = set(Ingredient.objects.filter(
+            name__in={name for name, _ in keys}
+        ).values_list('name', 'measurement_unit'))
+        # При пробном запуске строки не пишутся, поэтому повторы между
+        # пакетами отслеживаются в памяти.
+        new = keys - existing - self.planned
+        if dry_run:
+            self.planned |= new
+        self.counts['skipped'] += len(keys) - len(new)
+        self.counts['inserted'] += len(new)
+        if not dry_run:
+            Ingredient.objects.bulk_create(
+                [
+                    Ingredient(name=name, measurement_unit=measurement_unit)
+                    for name, measurement_unit in sorted(new)
+                ],
+                ignore_conflicts=True,
+            )
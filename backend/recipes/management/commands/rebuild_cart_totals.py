@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db.transaction import atomic
+
+from recipes.models import ShoppingCartIngredient
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает сводные списки покупок с нуля.'
+
+    @atomic
+    def handle(self, *args, **options):
+        ShoppingCartIngredient.objects.rebuild()
+        self.stdout.write(
+            'Пересчёт завершён, строк: '
+            f'{ShoppingCartIngredient.objects.count()}.'
+        )
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from recipes.models import FeedEntry
+
+
+class Command(BaseCommand):
+    help = (
+        'Заново строит ленты подписок пользователей, например после '
+        'загрузки подписок в обход API.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', type=int, action='append', dest='user_ids',
+            help='id пользователя; по умолчанию все.',
+        )
+
+    def handle(self, *args, **options):
+        FeedEntry.objects.rebuild(options['user_ids'])
+        self.stdout.write('Ленты подписок перестроены.')
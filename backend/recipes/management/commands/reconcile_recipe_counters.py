@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        'Сверяет счётчики избранного и списков покупок рецептов '
+        'с фактическими данными и исправляет расхождения.'
+    )
+
+    def handle(self, *args, **options):
+        fixed = Recipe.objects.reconcile_counters()
+        self.stdout.write(f'Исправлено рецептов: {fixed}.')
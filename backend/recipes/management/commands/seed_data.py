@@ -0,0 +1,160 @@
+import random
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db.transaction import atomic
+
+from recipes.models import (Favorite, FeedEntry, Ingredient, IngredientRecipe,
+                            Recipe, ShoppingCart, ShoppingCartIngredient, Tag)
+from recipes.search import update_search_index
+from users.models import Follow
+
+User = get_user_model()
+
+BATCH_SIZE = 1000
+
+TAGS = [
+    ('Завтрак', '#E26C2D', 'breakfast'),
+    ('Обед', '#49B64E', 'lunch'),
+    ('Ужин', '#8775D2', 'dinner'),
+    ('Десерт', '#F3C623', 'dessert'),
+    ('Перекус', '#2D9CDB', 'snack'),
+]
+
+
+class Command(BaseCommand):
+    help = 'Заполняет базу синтетическими данными для нагрузочных замеров.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=2000)
+        parser.add_argument('--recipes', type=int, default=20000)
+        parser.add_argument('--follows-per-user', type=int, default=20)
+        parser.add_argument('--favorites-per-user', type=int, default=30)
+        parser.add_argument('--cart-per-user', type=int, default=10)
+        parser.add_argument('--random-seed', type=int, default=42)
+
+    @atomic
+    def handle(self, *args, **options):
+        self.random = random.Random(options['random_seed'])
+        if not Ingredient.objects.exists():
+            call_command('load_ingredients')
+        tag_ids = self.create_tags()
+        user_ids = self.create_users(options['users'])
+        recipe_ids = self.create_recipes(user_ids, options['recipes'])
+        self.create_recipe_relations(recipe_ids, tag_ids)
+        update_search_index()
+        self.create_user_relations(user_ids, recipe_ids, options)
+        # bulk_create обходит сигналы и менеджеры, поэтому производные
+        # таблицы строятся заново по созданным данным.
+        ShoppingCartIngredient.objects.rebuild()
+        Recipe.objects.reconcile_counters()
+        FeedEntry.objects.rebuild()
+        self.stdout.write(
+            f'Создано пользователей: {len(user_ids)}, '
+            f'рецептов: {len(recipe_ids)}.'
+        )
+
+    def create_tags(self):
+        for name, color, slug in TAGS:
+            Tag.objects.get_or_create(
+                slug=slug, defaults={'name': name, 'color': color}
+            )
+        return list(Tag.objects.values_list('id', flat=True))
+
+    def create_users(self, count):
+        offset = User.objects.count()
+        last_id = User.objects.order_by('-id').values_list(
+            'id', flat=True
+        ).first() or 0
+        users = []
+        for index in range(offset, offset + count):
+            user = User(
+                username=f'bench_user_{index}',
+                email=f'bench_user_{index}@example.com',
+                first_name='Пользователь',
+                last_name=str(index),
+            )
+            user.set_unusable_password()
+            users.append(user)
+        User.objects.bulk_create(users, batch_size=BATCH_SIZE)
+        return list(
+            User.objects.filter(id__gt=last_id).values_list('id', flat=True)
+        )
+
+    def create_recipes(self, user_ids, count):
+        last_id = Recipe.objects.order_by('-id').values_list(
+            'id', flat=True
+        ).first() or 0
+        Recipe.objects.bulk_create(
+            (
+                Recipe(
+                    author_id=self.random.choice(user_ids),
+                    name=f'Рецепт №{index}',
+                    text='Смешать все ингредиенты и готовить до готовности.',
+                    cooking_time=self.random.randint(5, 180),
+                )
+                for index in range(count)
+            ),
+            batch_size=BATCH_SIZE,
+        )
+        return list(
+            Recipe.objects.filter(id__gt=last_id).values_list('id', flat=True)
+        )
+
+    def create_recipe_relations(self, recipe_ids, tag_ids):
+        ingredient_ids = list(Ingredient.objects.values_list('id', flat=True))
+        recipe_tags = []
+        recipe_ingredients = []
+        for recipe_id in recipe_ids:
+            for tag_id in self.random.sample(
+                tag_ids, self.random.randint(1, min(3, len(tag_ids)))
+            ):
+                recipe_tags.append(
+                    Recipe.tags.through(recipe_id=recipe_id, tag_id=tag_id)
+                )
+            for ingredient_id in self.random.sample(
+                ingredient_ids, self.random.randint(3, 8)
+            ):
+                recipe_ingredients.append(
+                    IngredientRecipe(
+                        recipe_id=recipe_id,
+                        ingredient_id=ingredient_id,
+                        amount=self.random.randint(1, 500),
+                    )
+                )
+        Recipe.tags.through.objects.bulk_create(
+            recipe_tags, batch_size=BATCH_SIZE
+        )
+        IngredientRecipe.objects.bulk_create(
+            recipe_ingredients, batch_size=BATCH_SIZE
+        )
+
+    def create_user_relations(self, user_ids, recipe_ids, options):
+        follows = []
+        favorites = []
+        cart = []
+        for user_id in user_ids:
+            authors = self.random.sample(
+                user_ids, min(options['follows_per_user'], len(user_ids))
+            )
+            follows.extend(
+                Follow(user_id=user_id, author_id=author_id)
+                for author_id in authors if author_id != user_id
+            )
+            favorites.extend(
+                Favorite(user_id=user_id, recipe_id=recipe_id)
+                for recipe_id in self.random.sample(
+                    recipe_ids,
+                    min(options['favorites_per_user'], len(recipe_ids)),
+                )
+            )
+            cart.extend(
+                ShoppingCart(user_id=user_id, recipe_id=recipe_id)
+                for recipe_id in self.random.sample(
+                    recipe_ids, min(options['cart_per_user'], len(recipe_ids))
+                )
+            )
+        Follow.objects.bulk_create(follows, batch_size=BATCH_SIZE)
+        Favorite.objects.bulk_create(favorites, batch_size=BATCH_SIZE)
+        ShoppingCart.objects.bulk_create(cart, batch_size=BATCH_SIZE)
@@ -0,0 +1,82 @@
+from collections import defaultdict
+
+from django.db import migrations
+
+# Копии значений из recipes.search на момент миграции: миграция не должна
+# зависеть от того, как поиск устроен в текущем коде.
+SEARCH_CONFIG = 'russian'
+SEARCH_VECTOR_COLUMN = 'search_vector'
+SEARCH_INDEX_NAME = 'recipe_search_vector_idx'
+FTS_TABLE = 'recipes_recipe_fts'
+
+
+def create_index(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    IngredientRecipe = apps.get_model('recipes', 'IngredientRecipe')
+    table = Recipe._meta.db_table
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            f'ALTER TABLE {table} ADD COLUMN {SEARCH_VECTOR_COLUMN} tsvector'
+        )
+        schema_editor.execute(
+            f'CREATE INDEX {SEARCH_INDEX_NAME} ON {table} '
+            f'USING gin ({SEARCH_VECTOR_COLUMN})'
+        )
+    elif vendor == 'sqlite':
+        schema_editor.execute(
+            f'CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5('
+            'name, text, ingredients, '
+            "tokenize = 'unicode61 remove_diacritics 2')"
+        )
+    else:
+        return
+
+    names = defaultdict(list)
+    for recipe_id, name in IngredientRecipe.objects.order_by(
+        'id'
+    ).values_list('recipe_id', 'ingredient__name'):
+        names[recipe_id].append(name)
+    with schema_editor.connection.cursor() as cursor:
+        for recipe_id, name, text in Recipe.objects.order_by(
+            'id'
+        ).values_list('id', 'name', 'text'):
+            ingredients = ' '.join(names[recipe_id])
+            if vendor == 'postgresql':
+                cursor.execute(
+                    f'UPDATE {table} SET {SEARCH_VECTOR_COLUMN} = '
+                    f"setweight(to_tsvector('{SEARCH_CONFIG}', %s), 'A') || "
+                    f"setweight(to_tsvector('{SEARCH_CONFIG}', %s), 'B') || "
+                    f"setweight(to_tsvector('{SEARCH_CONFIG}', %s), 'C') "
+                    'WHERE id = %s',
+                    [name, text, ingredients, recipe_id],
+                )
+            else:
+                cursor.execute(
+                    f'INSERT INTO {FTS_TABLE} '
+                    '(rowid, name, text, ingredients) VALUES (%s, %s, %s, %s)',
+                    [recipe_id, name, text, ingredients],
+                )
+
+
+def drop_index(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            f'ALTER TABLE {Recipe._meta.db_table} '
+            f'DROP COLUMN {SEARCH_VECTOR_COLUMN}'
+        )
+    elif vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE {FTS_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_recipe_image_renditions'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
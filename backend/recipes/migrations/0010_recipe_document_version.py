@@ -0,0 +1,18 @@
+# Generated by Django 3.2.14 on 2026-10-17 02:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_recipe_author_pub_date_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='document_version',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Версия закэшированного документа'),
+        ),
+    ]
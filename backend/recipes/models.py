@@ -1,11 +1,22 @@
+from collections import defaultdict
+
 from colorfield.fields import ColorField
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.core.validators import MinValueValidator
-from django.db import models
-from django.db.models import UniqueConstraint
+from django.db import connections, models, router, transaction
+from django.db.models import (BooleanField, Count, Exists, F, OuterRef,
+                              Prefetch, Q, Subquery, Sum, UniqueConstraint,
+                              Value, Window)
+from django.db.models.functions import Coalesce, RowNumber
+
+from users.models import Follow
 
 User = get_user_model()
 
+POPULAR_AUTHORS_KEY = 'feed-popular-authors'
+
 
 class Ingredient(models.Model):
     """ Модель ингредиентов. """
@@ -67,6 +78,131 @@ class Tag(models.Model):
         return self.name
 
 
+class RecipeQuerySet(models.QuerySet):
+    """Набор запросов рецептов."""
+
+    def with_related(self):
+        """Подгружает теги, ингредиенты и автора фиксированным числом
+        запросов."""
+        return self.select_related('author').prefetch_related(
+            'tags',
+            Prefetch(
+                'ingridients_recipe',
+                queryset=IngredientRecipe.objects.select_related(
+                    'ingredient'
+                ),
+            ),
+        )
+
+    def for_viewer(self, viewer):
+        """Аннотирует флаги избранного, списка покупок и подписки на автора
+        для пользователя."""
+        if not viewer.is_authenticated:
+            return self.annotate(
+                is_favorited=Value(False, output_field=BooleanField()),
+                is_in_shopping_cart=Value(False, output_field=BooleanField()),
+                author_is_subscribed=Value(
+                    False, output_field=BooleanField()
+                ),
+            )
+        return self.annotate(
+            is_favorited=Exists(
+                Favorite.objects.filter(user=viewer, recipe=OuterRef('pk'))
+            ),
+            is_in_shopping_cart=Exists(
+                ShoppingCart.objects.filter(
+                    user=viewer, recipe=OuterRef('pk')
+                )
+            ),
+            author_is_subscribed=Exists(
+                Follow.objects.filter(
+                    user=viewer, author=OuterRef('author_id')
+                )
+            ),
+        )
+
+    def cookable_with(self, ingredient_ids):
+        """Рецепты, в которых есть хотя бы один из ингредиентов.
+
+        Аннотирует число имеющихся (matched_count) и недостающих
+        (missing_count) ингредиентов рецепта.
+        """
+        def count(queryset):
+            return Coalesce(Subquery(
+                queryset.filter(recipe=OuterRef('pk')).order_by().values(
+                    'recipe'
+                ).annotate(total=Count('pk')).values('total')
+            ), 0)
+
+        available = IngredientRecipe.objects.filter(
+            ingredient_id__in=ingredient_ids
+        )
+        return self.filter(
+            id__in=available.values('recipe_id')
+        ).annotate(
+            matched_count=count(available),
+            missing_count=count(IngredientRecipe.objects.all()) - F(
+                'matched_count'
+            ),
+        )
+
+    def reconcile_counters(self):
+        """Пересчитывает счётчики избранного и списков покупок.
+
+        Возвращает число исправленных рецептов.
+        """
+        favorites = Subquery(
+            Favorite.objects.filter(recipe=OuterRef('pk')).order_by().values(
+                'recipe'
+            ).annotate(total=Count('pk')).values('total')
+        )
+        carts = Subquery(
+            ShoppingCart.objects.filter(
+                recipe=OuterRef('pk')
+            ).order_by().values('recipe').annotate(
+                total=Count('pk')
+            ).values('total')
+        )
+        return self.annotate(
+            actual_favorites=Coalesce(favorites, 0),
+            actual_carts=Coalesce(carts, 0),
+        ).exclude(
+            favorites_count=F('actual_favorites'),
+            in_carts_count=F('actual_carts'),
+        ).update(
+            favorites_count=Coalesce(favorites, 0),
+            in_carts_count=Coalesce(carts, 0),
+        )
+
+    def latest_by_author(self, author_ids, limit=None):
+        """Последние рецепты каждого из авторов одним запросом.
+
+        Возвращает словарь {author_id: [рецепты]}. Ограничение числа
+        рецептов на автора считается оконной функцией ROW_NUMBER().
+        """
+        queryset = self.filter(author_id__in=author_ids)
+        ordering = [F('pub_date').desc(), F('id').desc()]
+        if limit is None:
+            recipes = queryset.order_by(*ordering)
+        else:
+            sql, params = queryset.annotate(
+                row_number=Window(
+                    RowNumber(),
+                    partition_by=[F('author_id')],
+                    order_by=ordering,
+                )
+            ).order_by().query.sql_with_params()
+            recipes = self.raw(
+                f'SELECT * FROM ({sql}) ranked '
+                'WHERE row_number <= %s ORDER BY author_id, row_number',
+                [*params, limit],
+            )
+        grouped = defaultdict(list)
+        for recipe in recipes:
+            grouped[recipe.author_id].append(recipe)
+        return grouped
+
+
 class Recipe(models.Model):
     """Модель рецептов."""
 
@@ -80,6 +216,7 @@ class Recipe(models.Model):
         on_delete=models.CASCADE,
         related_name='recipes',
         verbose_name='Автор рецепта',
+        db_index=False,
     )
 
     name = models.CharField(
@@ -116,10 +253,47 @@ class Recipe(models.Model):
         default=None,
     )
 
+    image_renditions = models.JSONField(
+        verbose_name='Уменьшенные копии фото',
+        default=dict,
+        blank=True,
+    )
+
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='Добавлено в избранное',
+        default=0,
+    )
+
+    in_carts_count = models.PositiveIntegerField(
+        verbose_name='Добавлено в списки покупок',
+        default=0,
+    )
+
+    document_version = models.PositiveIntegerField(
+        verbose_name='Версия закэшированного документа',
+        default=0,
+        editable=False,
+    )
+
+    objects = RecipeQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ['-pub_date']
+        indexes = [
+            models.Index(
+                fields=['pub_date', 'id'], name='recipe_pub_date_id_idx'
+            ),
+            models.Index(
+                fields=['favorites_count', 'pub_date', 'id'],
+                name='recipe_popularity_idx',
+            ),
+            models.Index(
+                fields=['author', 'pub_date', 'id'],
+                name='recipe_author_pub_date_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -216,3 +390,357 @@ class ShoppingCart(models.Model):
 
     def __str__(self):
         return f'{self.recipe} - добавлено.'
+
+
+class ShoppingCartIngredientManager(models.Manager):
+    """Инкрементальное обновление сводного списка покупок."""
+
+    def expected(self):
+        """Суммы ингредиентов, посчитанные заново по спискам покупок."""
+        return IngredientRecipe.objects.filter(
+            recipe__shopping_cart__isnull=False
+        ).values(
+            'ingredient', user=F('recipe__shopping_cart__user')
+        ).annotate(amount=Sum('amount'))
+
+    def apply_deltas(self, deltas):
+        """Прибавляет изменения вида {(user_id, ingredient_id): delta}."""
+        deltas = {key: delta for key, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        user_ids = sorted({user_id for user_id, _ in deltas})
+        ingredient_ids = {ingredient_id for _, ingredient_id in deltas}
+        # Блокировка пользователей упорядочивает конкурирующие изменения
+        # одного списка, включая вставку ещё не существующих строк.
+        list(User.objects.select_for_update().filter(
+            pk__in=user_ids
+        ).order_by('pk').values_list('pk', flat=True))
+        existing = {
+            (row.user_id, row.ingredient_id): row
+            for row in self.filter(
+                user_id__in=user_ids, ingredient_id__in=ingredient_ids
+            )
+        }
+        to_create, to_update, to_delete = [], [], []
+        for (user_id, ingredient_id), delta in deltas.items():
+            row = existing.get((user_id, ingredient_id))
+            if row is None:
+                if delta > 0:
+                    to_create.append(self.model(
+                        user_id=user_id,
+                        ingredient_id=ingredient_id,
+                        amount=delta,
+                    ))
+                continue
+            row.amount += delta
+            if row.amount > 0:
+                to_update.append(row)
+            else:
+                to_delete.append(row.pk)
+        self.bulk_create(to_create)
+        self.bulk_update(to_update, ['amount'])
+        self.filter(pk__in=to_delete).delete()
+
+    def recipe_amounts(self, recipe_id):
+        return dict(IngredientRecipe.objects.filter(
+            recipe_id=recipe_id
+        ).values_list('ingredient_id', 'amount'))
+
+    def change_recipes(self, user, added=(), removed=()):
+        """Учитывает добавление и удаление рецептов в списке покупок."""
+        added, removed = set(map(int, added)), set(map(int, removed))
+        deltas = defaultdict(int)
+        rows = IngredientRecipe.objects.filter(
+            recipe_id__in=added | removed
+        ).values_list('recipe_id', 'ingredient_id', 'amount')
+        for recipe_id, ingredient_id, amount in rows:
+            sign = 1 if recipe_id in added else -1
+            deltas[user.id, ingredient_id] += sign * amount
+        self.apply_deltas(deltas)
+
+    def add_recipe(self, user, recipe_id):
+        self.change_recipes(user, added=[recipe_id])
+
+    def remove_recipe(self, user, recipe_id):
+        self.change_recipes(user, removed=[recipe_id])
+
+    def change_recipe(self, recipe_id, old_amounts, new_amounts):
+        """Учитывает изменение ингредиентов рецепта во всех списках."""
+        changes = {
+            ingredient_id: (
+                new_amounts.get(ingredient_id, 0)
+                - old_amounts.get(ingredient_id, 0)
+            )
+            for ingredient_id in {*old_amounts, *new_amounts}
+        }
+        user_ids = ShoppingCart.objects.filter(
+            recipe_id=recipe_id
+        ).values_list('user_id', flat=True)
+        self.apply_deltas({
+            (user_id, ingredient_id): delta
+            for user_id in user_ids
+            for ingredient_id, delta in changes.items()
+        })
+
+    def rebuild(self):
+        """Пересчитывает все суммы с нуля."""
+        self.all().delete()
+        self.bulk_create(
+            (
+                self.model(
+                    user_id=row['user'],
+                    ingredient_id=row['ingredient'],
+                    amount=row['amount'],
+                )
+                for row in self.expected().iterator()
+            ),
+            batch_size=1000,
+        )
+
+    def inconsistencies(self):
+        """Строки, в которых сохранённая сумма расходится с расчётной."""
+        expected = {
+            (row['user'], row['ingredient']): row['amount']
+            for row in self.expected().iterator()
+        }
+        stored = {
+            (row['user'], row['ingredient']): row['amount']
+            for row in self.values('user', 'ingredient', 'amount').iterator()
+        }
+        return {
+            key: (stored.get(key), expected.get(key))
+            for key in {*expected, *stored}
+            if stored.get(key) != expected.get(key)
+        }
+
+
+class ShoppingCartIngredient(models.Model):
+    """Модель сводного количества ингредиента в списке покупок."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_cart_ingredients',
+        verbose_name='Пользователь',
+    )
+
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_cart_ingredients',
+        verbose_name='Ингредиент',
+    )
+
+    amount = models.PositiveIntegerField(
+        verbose_name='Количество',
+    )
+
+    objects = ShoppingCartIngredientManager()
+
+    class Meta:
+        verbose_name = 'Ингредиент в списке покупок'
+        verbose_name_plural = 'Сводный список покупок'
+        constraints = [
+            UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_cart_ingredient'),
+        ]
+
+    def __str__(self):
+        return f'{self.user}: {self.ingredient} – {self.amount}'
+
+
+class FeedEntryManager(models.Manager):
+    """Ленты подписок пользователей.
+
+    Новый рецепт сразу раскладывается по лентам подписчиков автора
+    (fan-out on write). Рецепты популярных авторов, у которых не меньше
+    FEED_FANOUT_LIMIT подписчиков, в ленты не пишутся и подмешиваются
+    при чтении (fan-out on read). В ленте хранится не больше FEED_LENGTH
+    последних записей.
+    """
+
+    def popular_author_ids(self):
+        author_ids = cache.get(POPULAR_AUTHORS_KEY)
+        if author_ids is None:
+            author_ids = set(Follow.objects.values('author').annotate(
+                followers=Count('id')
+            ).filter(
+                followers__gte=settings.FEED_FANOUT_LIMIT
+            ).values_list('author', flat=True))
+            cache.set(
+                POPULAR_AUTHORS_KEY, author_ids,
+                settings.FEED_POPULAR_AUTHORS_TTL,
+            )
+        return author_ids
+
+    def fan_out(self, recipe):
+        """Добавляет новый рецепт в ленты подписчиков автора.
+
+        Ленты обрезаются после фиксации транзакции, чтобы не держать
+        создание рецепта на удалении старых записей из каждой ленты.
+        """
+        if recipe.author_id in self.popular_author_ids():
+            return
+        user_ids = list(Follow.objects.filter(
+            author_id=recipe.author_id
+        ).values_list('user_id', flat=True))
+        self.bulk_create(
+            [
+                self.model(
+                    user_id=user_id, recipe=recipe, pub_date=recipe.pub_date
+                )
+                for user_id in user_ids
+            ],
+            batch_size=settings.FEED_BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+        transaction.on_commit(lambda: self.trim_in_batches(user_ids))
+
+    def follow(self, user, author):
+        """Заполняет ленту последними рецептами нового автора."""
+        if author.id in self.popular_author_ids():
+            return
+        recipes = Recipe.objects.filter(author=author).order_by(
+            '-pub_date', '-id'
+        ).values_list('id', 'pub_date')[:settings.FEED_LENGTH]
+        self.bulk_create(
+            [
+                self.model(user=user, recipe_id=recipe_id, pub_date=pub_date)
+                for recipe_id, pub_date in recipes
+            ],
+            batch_size=settings.FEED_BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+        self.trim([user.id])
+
+    def unfollow(self, user, author):
+        self.filter(user=user, recipe__author=author).delete()
+
+    def trim(self, user_ids):
+        """Удаляет из лент всё, что старше FEED_LENGTH последних записей."""
+        if not user_ids:
+            return
+        sql, params = self.filter(user_id__in=user_ids).annotate(
+            position=Window(
+                RowNumber(),
+                partition_by=[F('user_id')],
+                order_by=[F('pub_date').desc(), F('recipe_id').desc()],
+            )
+        ).order_by().values('id', 'position').query.sql_with_params()
+        connection = connections[router.db_for_write(self.model)]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {self.model._meta.db_table} WHERE id IN ('
+                f'SELECT id FROM ({sql}) ranked WHERE position > %s)',
+                [*params, settings.FEED_LENGTH],
+            )
+
+    def trim_in_batches(self, user_ids):
+        for start in range(0, len(user_ids), settings.FEED_BATCH_SIZE):
+            self.trim(user_ids[start:start + settings.FEED_BATCH_SIZE])
+
+    def rebuild(self, user_ids=None):
+        """Заново строит ленты пользователей (по умолчанию всех)."""
+        entries = self.all()
+        if user_ids is None:
+            user_ids = list(Follow.objects.order_by('user_id').values_list(
+                'user_id', flat=True
+            ).distinct())
+        else:
+            entries = entries.filter(user_id__in=user_ids)
+        entries.delete()
+        popular = self.popular_author_ids()
+        for user_id in user_ids:
+            authors = Follow.objects.filter(user_id=user_id).exclude(
+                author_id__in=popular
+            ).values('author_id')
+            recipes = Recipe.objects.filter(author_id__in=authors).order_by(
+                '-pub_date', '-id'
+            ).values_list('id', 'pub_date')[:settings.FEED_LENGTH]
+            self.bulk_create(
+                [
+                    self.model(
+                        user_id=user_id, recipe_id=recipe_id,
+                        pub_date=pub_date,
+                    )
+                    for recipe_id, pub_date in recipes
+                ],
+                batch_size=settings.FEED_BATCH_SIZE,
+            )
+
+    def page_ids(self, user, position, limit):
+        """id рецептов страницы ленты после позиции (pub_date, id).
+
+        Из ленты и из рецептов популярных авторов читается не больше
+        limit строк, поэтому время чтения не зависит от числа подписок.
+        """
+        entries = self.filter(user=user)
+        popular = Follow.objects.filter(
+            user=user, author_id__in=self.popular_author_ids()
+        ).values('author_id')
+        recent = Recipe.objects.filter(author_id__in=popular)
+        if position is not None:
+            pub_date, recipe_id = position
+            entries = entries.filter(
+                Q(pub_date__lt=pub_date)
+                | Q(pub_date=pub_date, recipe_id__lt=recipe_id)
+            )
+            recent = recent.filter(
+                Q(pub_date__lt=pub_date)
+                | Q(pub_date=pub_date, id__lt=recipe_id)
+            )
+        rows = set(entries.order_by('-pub_date', '-recipe_id').values_list(
+            'pub_date', 'recipe_id'
+        )[:limit])
+        if self.popular_author_ids():
+            rows |= set(recent.order_by('-pub_date', '-id').values_list(
+                'pub_date', 'id'
+            )[:limit])
+        recipe_ids = [
+            recipe_id for _, recipe_id in sorted(rows, reverse=True)
+        ]
+        return recipe_ids[:limit]
+
+
+class FeedEntry(models.Model):
+    """Модель записи в ленте подписок пользователя."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Пользователь',
+    )
+
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Рецепт',
+    )
+
+    # Копия даты публикации рецепта: лента читается по индексу без JOIN.
+    pub_date = models.DateTimeField(
+        verbose_name='Дата публикации',
+    )
+
+    objects = FeedEntryManager()
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Ленты подписок'
+        constraints = [
+            UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_feed_entry'),
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', 'pub_date', 'recipe'],
+                name='feed_entry_user_pub_date_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.user}: {self.recipe}'
@@ -0,0 +1,127 @@
+"""Полнотекстовый поиск по рецептам.
+
+На PostgreSQL документ рецепта хранится в колонке search_vector
+с GIN-индексом (русская конфигурация), на SQLite — в виртуальной
+таблице FTS5. Обе структуры создаются миграцией и обновляются из кода
+приложения, потому что в документ входят названия ингредиентов из
+другой таблицы. На остальных СУБД поиск идёт по вхождению подстроки.
+"""
+from collections import defaultdict
+
+from django.db import connection
+from django.db.models import BooleanField, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+SEARCH_CONFIG = 'russian'
+SEARCH_VECTOR_COLUMN = 'search_vector'
+FTS_TABLE = 'recipes_recipe_fts'
+# Веса полей: название, описание, ингредиенты.
+FTS_WEIGHTS = (10.0, 4.0, 1.0)
+
+
+def recipe_documents(recipe_model, ingredient_recipe_model, recipe_ids=None):
+    """Строки (id, название, описание, ингредиенты) для индексации."""
+    recipes = recipe_model.objects.order_by('id')
+    ingredients = ingredient_recipe_model.objects.order_by('id')
+    if recipe_ids is not None:
+        recipes = recipes.filter(id__in=recipe_ids)
+        ingredients = ingredients.filter(recipe_id__in=recipe_ids)
+    names = defaultdict(list)
+    for recipe_id, name in ingredients.values_list(
+        'recipe_id', 'ingredient__name'
+    ):
+        names[recipe_id].append(name)
+    for recipe_id, name, text in recipes.values_list('id', 'name', 'text'):
+        yield recipe_id, name, text, ' '.join(names[recipe_id])
+
+
+def write_documents(documents, table, db_connection=connection):
+    vendor = db_connection.vendor
+    with db_connection.cursor() as cursor:
+        for recipe_id, name, text, ingredients in documents:
+            if vendor == 'postgresql':
+                cursor.execute(
+                    f'UPDATE {table} SET {SEARCH_VECTOR_COLUMN} = '
+                    f"setweight(to_tsvector('{SEARCH_CONFIG}', %s), 'A') || "
+                    f"setweight(to_tsvector('{SEARCH_CONFIG}', %s), 'B') || "
+                    f"setweight(to_tsvector('{SEARCH_CONFIG}', %s), 'C') "
+                    'WHERE id = %s',
+                    [name, text, ingredients, recipe_id],
+                )
+            elif vendor == 'sqlite':
+                cursor.execute(
+                    f'INSERT OR REPLACE INTO {FTS_TABLE} '
+                    '(rowid, name, text, ingredients) VALUES (%s, %s, %s, %s)',
+                    [recipe_id, name, text, ingredients],
+                )
+
+
+def update_search_index(recipe_ids=None):
+    """Переиндексирует указанные рецепты или все, если ids не заданы."""
+    from .models import IngredientRecipe, Recipe
+
+    write_documents(
+        recipe_documents(Recipe, IngredientRecipe, recipe_ids),
+        Recipe._meta.db_table,
+    )
+
+
+def remove_from_search_index(recipe_ids):
+    if connection.vendor != 'sqlite' or not recipe_ids:
+        return
+    placeholders = ', '.join(['%s'] * len(recipe_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})',
+            list(recipe_ids),
+        )
+
+
+def fts_query(query):
+    """Запрос FTS5: каждое слово в кавычках и с поиском по префиксу."""
+    return ' '.join(
+        '"{}"*'.format(word.replace('"', '""')) for word in query.split()
+    )
+
+
+def search_recipes(queryset, query):
+    """Рецепты, подходящие под запрос, с релевантностью в поле rank."""
+    query = query.strip()
+    if not query:
+        return queryset
+    table = queryset.model._meta.db_table
+    vendor = connection.vendor
+    if vendor == 'postgresql':
+        tsquery = f"websearch_to_tsquery('{SEARCH_CONFIG}', %s)"
+        column = f'{table}.{SEARCH_VECTOR_COLUMN}'
+        matches = RawSQL(
+            f'{column} @@ {tsquery}', [query], output_field=BooleanField()
+        )
+        rank = RawSQL(
+            f'ts_rank_cd({column}, {tsquery})', [query],
+            output_field=FloatField(),
+        )
+    elif vendor == 'sqlite':
+        query = fts_query(query)
+        weights = ', '.join(str(weight) for weight in FTS_WEIGHTS)
+        matches = RawSQL(
+            f'{table}.id IN (SELECT rowid FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s)',
+            [query], output_field=BooleanField(),
+        )
+        # bm25 тем меньше, чем выше релевантность. Вложенный запрос
+        # с LIMIT -1 не встраивается в коррелированный и вычисляется
+        # один раз, а не поиском по индексу для каждой строки.
+        rank = RawSQL(
+            'SELECT ranked.rank FROM ('
+            f'SELECT rowid AS id, -bm25({FTS_TABLE}, {weights}) AS rank '
+            f'FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s LIMIT -1'
+            f') ranked WHERE ranked.id = {table}.id',
+            [query], output_field=FloatField(),
+        )
+    else:
+        return queryset.filter(
+            Q(name__icontains=query) | Q(text__icontains=query)
+            | Q(ingredients__name__icontains=query)
+        ).distinct().annotate(rank=Value(0.0, output_field=FloatField()))
+    return queryset.filter(matches).annotate(rank=rank)
@@ -0,0 +1,35 @@
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .ingredient_index import ingredient_index
+from .models import Ingredient, Recipe, ShoppingCartIngredient
+from .search import remove_from_search_index, update_search_index
+
+
+@receiver([post_save, post_delete], sender=Ingredient)
+def invalidate_ingredient_index(sender, **kwargs):
+    ingredient_index.invalidate()
+
+
+@receiver(post_save, sender=Ingredient)
+def reindex_ingredient_recipes(sender, instance, created, **kwargs):
+    if not created:
+        update_search_index(list(
+            instance.recipes.values_list('id', flat=True)
+        ))
+
+
+@receiver(post_delete, sender=Recipe)
+def remove_recipe_from_search(sender, instance, **kwargs):
+    remove_from_search_index([instance.id])
+
+
+@receiver(pre_delete, sender=Recipe)
+def remove_recipe_from_carts(sender, instance, **kwargs):
+    # Срабатывает и при каскадном удалении, например вместе с автором,
+    # пока строки состава и списков покупок ещё на месте.
+    ShoppingCartIngredient.objects.change_recipe(
+        instance.id,
+        ShoppingCartIngredient.objects.recipe_amounts(instance.id),
+        {},
+    )
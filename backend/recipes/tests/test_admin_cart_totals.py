@@ -0,0 +1,110 @@
+from api.tests.base import APITestCase
+from recipes.models import (IngredientRecipe, Recipe, ShoppingCart,
+                            ShoppingCartIngredient)
+
+
+class AdminCartTotalsTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.admin = cls.create_user('admin')
+        cls.admin.is_staff = cls.admin.is_superuser = True
+        cls.admin.save()
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.admin)
+        self.recipe = self.create_recipe()
+        # Фото обязательно в форме админки; файл для проверки не нужен.
+        self.recipe.image = 'recipes/images/pancakes.png'
+        self.recipe.save(update_fields=['image'])
+        ShoppingCart.objects.create(user=self.user, recipe=self.recipe)
+        ShoppingCartIngredient.objects.rebuild()
+
+    def assert_totals_consistent(self):
+        self.assertEqual(ShoppingCartIngredient.objects.inconsistencies(), {})
+
+    def test_recipe_delete(self):
+        response = self.client.post(
+            f'/admin/recipes/recipe/{self.recipe.id}/delete/', {'post': 'yes'}
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(ShoppingCartIngredient.objects.exists())
+
+    def test_author_delete_cascades_to_totals(self):
+        self.author.delete()
+        self.assertFalse(Recipe.objects.exists())
+        self.assertFalse(ShoppingCartIngredient.objects.exists())
+
+    def test_recipe_inline_edit(self):
+        rows = list(self.recipe.ingridients_recipe.order_by('id'))
+        prefix = 'ingridients_recipe'
+        data = {
+            'name': self.recipe.name,
+            'text': self.recipe.text,
+            'cooking_time': self.recipe.cooking_time,
+            'author': self.author.id,
+            'tags': [self.tag.id],
+            'image_renditions': '{}',
+            f'{prefix}-TOTAL_FORMS': 2,
+            f'{prefix}-INITIAL_FORMS': 2,
+            f'{prefix}-MIN_NUM_FORMS': 1,
+            f'{prefix}-MAX_NUM_FORMS': 1000,
+        }
+        for number, row in enumerate(rows):
+            data.update({
+                f'{prefix}-{number}-id': row.id,
+                f'{prefix}-{number}-recipe': self.recipe.id,
+                f'{prefix}-{number}-ingredient': row.ingredient_id,
+                f'{prefix}-{number}-amount': row.amount + 1,
+            })
+        data[f'{prefix}-0-DELETE'] = 'on'
+        response = self.client.post(
+            f'/admin/recipes/recipe/{self.recipe.id}/change/', data
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(
+            dict(ShoppingCartIngredient.objects.values_list(
+                'ingredient_id', 'amount'
+            )),
+            {rows[1].ingredient_id: rows[1].amount + 1},
+        )
+        self.assert_totals_consistent()
+
+    def test_ingredient_row_edit_and_delete(self):
+        row = IngredientRecipe.objects.get(
+            recipe=self.recipe, ingredient=self.salt
+        )
+        response = self.client.post(
+            f'/admin/recipes/ingredientrecipe/{row.id}/change/', {
+                'recipe': self.recipe.id,
+                'ingredient': self.salt.id,
+                'amount': 7,
+            }
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assert_totals_consistent()
+        response = self.client.post(
+            f'/admin/recipes/ingredientrecipe/{row.id}/delete/',
+            {'post': 'yes'},
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assert_totals_consistent()
+
+    def test_shopping_cart_add_and_delete(self):
+        other = self.create_recipe(name='Оладьи')
+        response = self.client.post('/admin/recipes/shoppingcart/add/', {
+            'user': self.user.id, 'recipe': other.id,
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assert_totals_consistent()
+        response = self.client.post('/admin/recipes/shoppingcart/', {
+            'action': 'delete_selected',
+            '_selected_action': list(
+                ShoppingCart.objects.values_list('id', flat=True)
+            ),
+            'post': 'yes',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(ShoppingCartIngredient.objects.exists())
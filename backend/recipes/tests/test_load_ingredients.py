@@ -0,0 +1,50 @@
+import io
+import json
+import os
+import tempfile
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from api.tests.base import TEST_CACHES
+from recipes.models import Ingredient
+
+
+@override_settings(CACHES=TEST_CACHES)
+class LoadIngredientsTests(TestCase):
+
+    def load(self, filename, content):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, filename)
+            with open(path, 'w', encoding='utf-8') as file:
+                file.write(content)
+            stdout = io.StringIO()
+            call_command('load_ingredients', path, stdout=stdout)
+        return stdout.getvalue()
+
+    def test_json_counts_malformed_rows_as_invalid(self):
+        output = self.load('ingredients.json', json.dumps([
+            {'name': 'соль', 'measurement_unit': 'г'},
+            {'name': None, 'measurement_unit': 'г'},
+            {'name': 'сахар', 'measurement_unit': 5},
+            ['мука', 'г'],
+            'перец',
+            None,
+        ]))
+        self.assertIn('Добавлено: 1, пропущено: 0, с ошибками: 5.', output)
+        self.assertEqual(
+            list(Ingredient.objects.values_list('name', flat=True)), ['соль']
+        )
+
+    def test_jsonl_counts_malformed_lines_as_invalid(self):
+        output = self.load('ingredients.jsonl', '\n'.join([
+            '{"name": "соль", "measurement_unit": "г"}',
+            '{"name": "мука", "measurement_unit": null}',
+            '["сахар", "г"]',
+            '{"name": "перец",',
+            '',
+        ]))
+        self.assertIn('Добавлено: 1, пропущено: 0, с ошибками: 3.', output)
+        self.assertEqual(
+            list(Ingredient.objects.values_list('name', flat=True)), ['соль']
+        )
@@ -1,5 +1,6 @@
-from django.contrib.auth.models import AbstractUser
+from django.contrib.auth.models import AbstractUser, UserManager
 from django.db import models
+from django.db.models import BooleanField, Exists, OuterRef, Value
 
 
 class UserRole:
@@ -11,6 +12,26 @@ class UserRole:
     ]
 
 
+class UserQuerySet(models.QuerySet):
+    """Набор запросов пользователей."""
+
+    def with_is_subscribed(self, viewer):
+        """Аннотирует флаг подписки просматривающего пользователя."""
+        if not viewer.is_authenticated:
+            return self.annotate(
+                is_subscribed=Value(False, output_field=BooleanField())
+            )
+        return self.annotate(
+            is_subscribed=Exists(
+                Follow.objects.filter(user=viewer, author=OuterRef('pk'))
+            )
+        )
+
+
+class CustomUserManager(UserManager.from_queryset(UserQuerySet)):
+    """Менеджер пользователей с аннотациями для API."""
+
+
 class User(AbstractUser):
     """Модель пользователя."""
 
@@ -46,6 +67,8 @@ class User(AbstractUser):
         verbose_name='Статус',
     )
 
+    objects = CustomUserManager()
+
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name']
 
@@ -93,6 +116,11 @@ class Follow(models.Model):
                 fields=['user', 'author'],
                 name='unique_user_author'),
         ]
+        indexes = [
+            models.Index(
+                fields=['author', 'user'], name='follow_author_user_idx'
+            ),
+        ]
 
     def __str__(self):
         return f'{self.user} подписался на {self.author}'